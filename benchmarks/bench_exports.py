@@ -0,0 +1,121 @@
+"""
+Benchmark of loading large Zotero and Mendeley exports with parsers.py.
+
+Usage:
+
+    python benchmarks/bench_exports.py [--entries N] [REPO_DIR ...]
+
+Writes a synthetic Zotero (Better BibTeX) and a Mendeley style export of N
+abstract-heavy entries, and measures the time to load them, the time to
+load them and read the fields of every entry, and the peak memory traced
+while loading them. The checkouts in REPO_DIR are compared side by side as
+in bench_parse.py.
+"""
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from bench_parse import compare
+
+WORDS = (
+    "water dynamics fast structure kinetics molecular ionic study method protein"
+    " membrane simulation results show that we the of and in a for with"
+).split()
+
+
+def sentence(r: random.Random, n: int) -> str:
+    return " ".join(r.choice(WORDS) for _ in range(n))
+
+
+def abstract(r: random.Random) -> str:
+    return ". ".join(sentence(r, 15) for _ in range(r.randrange(8, 20)))
+
+
+def zotero_entry(r: random.Random, i: int) -> str:
+    text = abstract(r)
+    if r.random() < 0.3:
+        text = text.replace(". ", ".\n  ", 3)
+    fields = [
+        ("title", sentence(r, 8).capitalize() + ": {DNA} and $\\alpha$-Helix"),
+        ("author", "Smith, John and Doe, Jane and Nu{\\~n}ez, J. M."),
+        ("date", "{}-0{}-01".format(r.randrange(1990, 2024), r.randrange(1, 9))),
+        ("journaltitle", "J. Chem. Phys."),
+        ("volume", str(r.randrange(1, 200))),
+        ("number", str(r.randrange(1, 24))),
+        ("pages", "{}--{}".format(r.randrange(1, 999), r.randrange(1000, 2000))),
+        ("doi", "10.1063/1.{}".format(r.randrange(10**6))),
+        ("url", "https://pubs.example.org/doi/full/10.1063/1.{}?a=b&x=y".format(i)),
+        ("urldate", "2020-01-02"),
+        ("abstract", text),
+        ("keywords", sentence(r, 3).replace(" ", ", ")),
+        ("file", "/Users/me/Zotero/storage/{0:08X}/Smith et al. - {0}.pdf".format(i)),
+    ]
+    key = "smith{}{}".format(sentence(r, 2).title().replace(" ", ""), i)
+    return "@article{{{},\n{}\n}}\n".format(
+        key, ",\n".join("  {} = {{{}}}".format(name, value) for name, value in fields)
+    )
+
+
+def mendeley_entry(r: random.Random, i: int) -> str:
+    fields = [
+        ("abstract", abstract(r)),
+        ("author", "Smith, John and Doe, Jane"),
+        ("doi", "10.1063/1.{}".format(r.randrange(10**6))),
+        ("file", ":Users/me/Mendeley Desktop/Smith et al. - {}.pdf:pdf".format(i)),
+        ("issn", "0021-9606"),
+        ("journal", "J. Chem. Phys."),
+        ("keywords", sentence(r, 3).replace(" ", ",")),
+        ("mendeley-groups", "Thesis"),
+        ("number", str(r.randrange(1, 24))),
+        ("pages", str(r.randrange(1, 999))),
+        ("title", "{{{}}}".format(sentence(r, 8).capitalize())),
+        ("url", "http://dx.doi.org/10.1063/1.{}".format(i)),
+        ("volume", str(r.randrange(1, 200))),
+        ("year", str(r.randrange(1990, 2024))),
+    ]
+    return "@article{{Smith{},\n{}\n}}\n".format(
+        i, ",\n".join("{} = {{{}}}".format(name, value) for name, value in fields)
+    )
+
+
+def best(function, repeat: int = 3) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run(n_entries: int) -> dict[str, float]:
+    """
+    Runs the benchmark with the parsers module found in sys.path.
+    """
+    import parsers
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, entry in (("Zotero", zotero_entry), ("Mendeley", mendeley_entry)):
+            r = random.Random(0)
+            fname = os.path.join(directory, name + ".bib")
+            with open(fname, "w") as f:
+                f.write("\n".join(entry(r, i) for i in range(n_entries)))
+
+            def read_all():
+                for bib_entry in parsers.BibFile(fname).bib_entries.values():
+                    bib_entry.fields
+
+            results["{} load (s)".format(name)] = best(lambda: parsers.BibFile(fname))
+            results["{} load + read fields (s)".format(name)] = best(read_all)
+            tracemalloc.start()
+            parsers.BibFile(fname)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results["{} load peak (MiB)".format(name)] = peak / 2**20
+    return results
+
+
+if __name__ == "__main__":
+    compare(run, __doc__, __file__, 20000)
@@ -0,0 +1,68 @@
+"""
+Memory retained by the bib entries of a parsed BibFile, measured with
+tracemalloc.
+
+Usage:
+
+    python benchmarks/bench_memory.py [--entries N] [REPO_DIR ...]
+
+The REPO_DIRs are compared side by side as in bench_parse.py. The text of
+the file, which newer versions keep to reload it, is not counted in the
+bytes per entry. The entries are measured as parsed and after reading their
+fields, since newer versions parse the fields on first access.
+"""
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+from bench_parse import compare, generate_bib
+
+
+def retained(bib_file) -> int:
+    """
+    Returns the bytes allocated since tracemalloc started, without the
+    text of the file kept by bib_file.
+    """
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    source = getattr(bib_file, "_source", None)
+    if source is not None:
+        size -= len(source.content.encode("utf-8"))
+    return size
+
+
+def run(n_entries: int) -> dict[str, float]:
+    """
+    Runs the benchmarks with the parsers module found in sys.path.
+    """
+    import parsers
+
+    with tempfile.TemporaryDirectory() as directory:
+        fname = os.path.join(directory, "library.bib")
+        with open(fname, "w") as f:
+            for entry_type, key, fields in generate_bib(n_entries):
+                f.write("@{}{{{},\n{}}}\n\n".format(entry_type, key, fields))
+
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        bib_file = parsers.BibFile(fname)
+        seconds = time.perf_counter() - start
+        parsed = retained(bib_file)
+        for entry in bib_file.bib_entries.values():
+            entry.fields
+        read = retained(bib_file)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {
+        "BibFile parse, traced (s)": seconds,
+        "Peak (MiB)": peak / 2**20,
+        "Parsed entries (B/entry)": parsed / n_entries,
+        "Entries with fields read (B/entry)": read / n_entries,
+    }
+
+
+if __name__ == "__main__":
+    compare(run, __doc__, __file__, 20000)
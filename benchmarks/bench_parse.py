@@ -0,0 +1,227 @@
+"""
+Micro-benchmarks of the parsing hot paths of parsers.py.
+
+Usage:
+
+    python benchmarks/bench_parse.py [--entries N] [REPO_DIR ...]
+
+Each REPO_DIR is a directory containing a parsers.py (the directory of this
+repository by default). The benchmarks of each one are run in a separate
+process and printed side by side, so the cost before and after a change can
+be compared with a checkout of the previous version, e.g.:
+
+    git worktree add /tmp/before HEAD~1
+    python benchmarks/bench_parse.py /tmp/before .
+
+Only the public API is used, so any version of parsers.py can be measured.
+The inputs are generated with a fixed seed.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import timeit
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SURNAMES = ["Garc\\'ia", "M\\\"uller", "Nu\\~nez", "Smith", "Fran\\c{c}ois", "O'Brien"]
+WORDS = [
+    "Fast",
+    "dynamics",
+    "of",
+    "Na\\\"ive",
+    "water",
+    "{DNA}",
+    "structure",
+    "--",
+    "$\\alpha$-helix",
+    "\\textit{in vivo}",
+    "study",
+]
+
+
+def generate_fields(r: random.Random) -> str:
+    """
+    Returns the text of the fields of an entry, as found after its key.
+    """
+    authors = " and ".join(
+        "{}, {}".format(r.choice(SURNAMES), r.choice(["J. M.", "JM", "A", "Ana"]))
+        for _ in range(r.randint(1, 4))
+    )
+    fields = [
+        ("author", "{" + authors + "}"),
+        ("title", "{" + " ".join(r.sample(WORDS, r.randint(4, len(WORDS)))) + "}"),
+        ("journal", "{J. Chem. Phys.}"),
+        ("year", str(r.randint(1990, 2024))),
+        ("volume", '"{}"'.format(r.randint(1, 200))),
+        ("doi", "{{10.1063/{}}}".format(r.randint(0, 10**6))),
+    ]
+    return ",\n".join("  {} = {}".format(name, value) for name, value in fields) + "\n"
+
+
+def generate_bib(n: int) -> list[tuple[str, str, str]]:
+    """
+    Returns n (type, key, fields text) entries.
+    """
+    r = random.Random(0)
+    return [
+        (
+            r.choice(["article", "book", "inproceedings"]),
+            "key{}".format(i),
+            generate_fields(r),
+        )
+        for i in range(n)
+    ]
+
+
+def write_latex(directory: str, n_chapters: int = 20, n_paragraphs: int = 50):
+    """
+    Writes a main.tex that inputs n_chapters chapters with citations, labels,
+    references and figures.
+    """
+    r = random.Random(0)
+    os.makedirs(os.path.join(directory, "chapters"))
+    with open(os.path.join(directory, "main.tex"), "w") as f:
+        f.write("\\documentclass{article}\n\\usepackage[utf8]{inputenc}\n")
+        f.write("\\title{A thesis}\n\\begin{document}\n")
+        for i in range(n_chapters):
+            f.write("\\input{{chapters/ch{}}}\n".format(i))
+        f.write("\\end{document}\n")
+    for i in range(n_chapters):
+        with open(os.path.join(directory, "chapters", "ch{}.tex".format(i)), "w") as f:
+            f.write("\\section{{Chapter {}}}\n\\label{{sec:ch{}}}\n".format(i, i))
+            for j in range(n_paragraphs):
+                keys = ",".join("key{}".format(r.randint(0, 999)) for _ in range(3))
+                f.write(
+                    "Text of paragraph {} as shown in \\cite{{{}}} and Fig."
+                    " \\ref{{fig:{}-{}}}.\n\n".format(j, keys, i, j)
+                )
+                if j % 10 == 0:
+                    f.write(
+                        "\\begin{{figure}}\n\\includegraphics[width=5cm]"
+                        "{{figs/f{0}-{1}.pdf}}\n\\label{{fig:{0}-{1}}}\n"
+                        "\\end{{figure}}\n".format(i, j)
+                    )
+                    f.write("\\subsection*{{Part {}}}\n".format(j))
+
+
+def per_call(function, number: int, repeat: int = 5) -> float:
+    """
+    Returns the best time of function in microseconds.
+    """
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number * 1e6
+
+
+def run(n_entries: int) -> dict[str, float]:
+    """
+    Runs the benchmarks with the parsers module found in sys.path.
+    """
+    import parsers
+
+    entries = generate_bib(n_entries)
+    results = {}
+
+    def parse_entries():
+        for entry_type, key, fields in entries:
+            parsers.BibEntry(entry_type, key, fields).fields
+
+    results["BibEntry parse (us/entry)"] = per_call(parse_entries, 1) / n_entries
+    title = "{Fast Dynamics of Na\\\"ive Water {DNA} Structure -- a Study}"
+    results["convert_to_lower_unicode (us/call)"] = per_call(
+        lambda: parsers.convert_to_lower_unicode(title), 10000
+    )
+    authors = "J. M. Nu\\~nez and Fran\\c{c}ois, J. M."
+    results["simplify_field (us/call)"] = per_call(
+        lambda: parsers.simplify_field(authors), 10000
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        fname = os.path.join(directory, "library.bib")
+        with open(fname, "w") as f:
+            for entry_type, key, fields in entries:
+                f.write("@{}{{{},\n{}}}\n\n".format(entry_type, key, fields))
+
+        def parse_bib():
+            for entry in parsers.BibFile(fname).bib_entries.values():
+                entry.fields
+
+        results["BibFile parse (us/entry)"] = per_call(parse_bib, 1) / n_entries
+
+        write_latex(directory)
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+
+            def latex_pipeline():
+                latex_file = parsers.LatexFile("main.tex")
+                latex_file.substitute_inputs()
+                latex_file.fix_partial_paths()
+                latex_file.fix_labels_refs()
+                latex_file.adapt_citations()
+                latex_file.extract_sections()
+
+            results["LatexFile pipeline (ms)"] = per_call(latex_pipeline, 1) / 1e3
+            if hasattr(parsers.LatexFile, "transform"):
+                # The same steps as latex_pipeline in a single pass
+                results["LatexFile.transform (ms)"] = (
+                    per_call(lambda: parsers.LatexFile("main.tex").transform(), 1)
+                    / 1e3
+                )
+            latex_file = parsers.LatexFile("main.tex")
+            latex_file.substitute_inputs()
+            for name in ("fix_partial_paths", "fix_labels_refs", "adapt_citations"):
+                results["LatexFile.{} (ms)".format(name)] = (
+                    per_call(getattr(latex_file, name), 1) / 1e3
+                )
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def compare(run, doc: str, script: str, default_entries: int):
+    """
+    Runs run(entries) of script with the parsers module of each checkout
+    given in the command line, in a separate process, and prints the results
+    side by side. The results missing in a checkout are printed as "-".
+    """
+    parser = argparse.ArgumentParser(description=doc.split("\n\n")[0].strip())
+    parser.add_argument("repo_dirs", nargs="*", default=[REPO_DIR])
+    parser.add_argument("--entries", type=int, default=default_entries)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        sys.path.insert(0, os.path.abspath(args.repo_dirs[0]))
+        print(json.dumps(run(args.entries)))
+        return
+
+    columns = []
+    for repo_dir in args.repo_dirs:
+        output = subprocess.run(
+            [sys.executable, script, "--worker", "--entries", str(args.entries)]
+            + [repo_dir],
+            check=True,
+            stdout=subprocess.PIPE,
+            text=True,
+        ).stdout
+        columns.append(json.loads(output.splitlines()[-1]))
+    width = max(10, *(len(repo_dir) for repo_dir in args.repo_dirs)) + 2
+    print(
+        "{:40s}".format("")
+        + "".join("{:>{}s}".format(repo_dir, width) for repo_dir in args.repo_dirs)
+    )
+    for name in dict.fromkeys(name for column in columns for name in column):
+        print(
+            "{:40s}".format(name)
+            + "".join(
+                "{:>{}.2f}".format(column[name], width)
+                if name in column
+                else "{:>{}s}".format("-", width)
+                for column in columns
+            )
+        )
+
+
+if __name__ == "__main__":
+    compare(run, __doc__, __file__, 2000)
@@ -1,8 +1,19 @@
-from collections import deque
+import array
+import bisect
 import difflib
+import hashlib
+import itertools
+import marshal
+import mmap
 import os
+import random
 import re
-from typing import Any
+import sys
+import tempfile
+import time
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, TextIO, Union
 from tqdm import tqdm
 from functools import lru_cache
 
@@ -11,323 +22,2934 @@ from pylatexenc.latex2text import LatexNodes2Text
 
 ACCENT_CONVERTER = LatexNodes2Text()
 
+# Fields whose values are combined to build the blocking keys of
+# BibEntry.similarity_block_keys
+SIMILARITY_BLOCKING_FIELDS = (
+    "author",
+    "title",
+    "journal",
+    "booktitle",
+    "year",
+    "volume",
+    "number",
+    "pages",
+)
+# Blocking fields shared by many entries, which only give blocking keys in
+# triples or paired with another blocking field
+SIMILARITY_WEAK_FIELDS = ("journal", "booktitle", "year", "volume", "number")
+
+# Version of the format of the parse cache (see BibFile.parse_bib)
+_CACHE_VERSION = 2
+
+
+# LaTeX converted without pylatexenc (see latex_to_text). The groups are:
+# accent macro followed by a letter (1-3 and 4-6), escaped character (7),
+# group brace (8), ligature (9) and anything else pylatexenc converts (10).
+# Whitespace may contain one newline, as a blank line is a paragraph break,
+# and the whitespace after a dotless i or j must be followed by text.
+_SPACE = r"[ \t]*(?:\n[ \t]*)?"
+_ACCENT_LETTER = r"([A-Za-z]|\\[ij](?![^\W\d_])[ \t]*(?![ \t\r\n]))"
+_FAST_LATEX_RE = re.compile(
+    r"\\(['\"`^~=.])" + _SPACE + r"(?:\{" + _SPACE + _ACCENT_LETTER + _SPACE + r"\}|"
+    + _ACCENT_LETTER + ")"
+    r"|\\([uvHckdrb])(?:" + _SPACE + r"\{" + _SPACE + _ACCENT_LETTER + _SPACE + r"\}"
+    r"|(?:[ \t]+(?:\n[ \t]*)?|\n[ \t]*)" + _ACCENT_LETTER + ")"
+    r"|\\([&%$_#])"
+    r"|([{}])"
+    r"|(---|--|~)"
+    r"|([\\$%&`]|'')"
+)
+_LIGATURES = {"---": "\u2014", "--": "\u2013", "~": "\xa0"}
+# Accented letters converted by pylatexenc, e.g. {"'e": "é"}
+_ACCENTED_LETTERS: dict[str, str] = {}
+
+
+class _UnsupportedLatex(Exception):
+    pass
+
+
+def _fast_latex_replacement(match: re.Match) -> str:
+    group = match.lastindex
+    if group == 7:
+        return match.group(7)
+    if group == 8:
+        return ""
+    if group == 9:
+        return _LIGATURES[match.group(9)]
+    if group == 10:
+        raise _UnsupportedLatex
+    accent = match.group(1) or match.group(4)
+    letter = accent + match.group(group).strip()
+    if letter not in _ACCENTED_LETTERS:
+        _ACCENTED_LETTERS[letter] = ACCENT_CONVERTER.latex_to_text(
+            "\\{}{{{}}}".format(letter[0], letter[1:])
+        )
+    return _ACCENTED_LETTERS[letter]
+
+
+@lru_cache(maxsize=4096)
+def _slow_latex_to_text(text: str) -> str:
+    return ACCENT_CONVERTER.latex_to_text(text)
+
+
+def latex_to_text(text: str) -> str:
+    """
+    Converts LaTeX to text as ACCENT_CONVERTER.latex_to_text.
+
+    Accent macros on a letter, escaped characters, dashes and braces are
+    converted with a regular expression and a table of accented letters.
+    pylatexenc only parses the text if it contains other LaTeX.
+    """
+    try:
+        return _FAST_LATEX_RE.sub(_fast_latex_replacement, text)
+    except _UnsupportedLatex:
+        return _slow_latex_to_text(text)
+
+
+# Characters removed by convert_to_lower_unicode and simplify_field
+_LOWER_UNICODE_REMOVED_RE = re.compile(r"[ {}]")
+_SIMPLIFY_REMOVED_RE = re.compile(r"[{}.]")
+
+
+def _lower_unicode(unicode: str) -> str:
+    return _LOWER_UNICODE_REMOVED_RE.sub("", unicode.lower())
+
+
+def _simplify_unicode(text: str) -> str:
+    # remove brackets and dots and lowercase
+    text = _SIMPLIFY_REMOVED_RE.sub("", text.lower())
+    # replace double dash with single dash
+    return text.replace("--", "-")
+
+
+def convert_to_lower_unicode(text: str) -> str:
+    """Converts text to lower unicode and removes brackets."""
+    return _lower_unicode(latex_to_text(text))
+
+
+def simplify_field(text: str) -> str:
+    return _simplify_unicode(latex_to_text(text))
+
+
+def _normalize_batch(texts: Iterable[str], normalize: Callable[[str], str]) -> list[str]:
+    """
+    Converts the distinct texts to unicode and applies normalize to all of
+    them at once, joined by newlines. normalize must work line by line (like
+    lowercasing or removing characters). Returns the results aligned with
+    texts.
+    """
+    texts = list(texts)
+    distinct = list(dict.fromkeys(texts))
+    unicode = [latex_to_text(text) for text in distinct]
+    joined = "\n".join(unicode)
+    if joined.count("\n") == len(distinct) - 1:
+        results = normalize(joined).split("\n")
+    else:
+        # Some text has newlines (or there is none)
+        results = [normalize(text) for text in unicode]
+    normalized = dict(zip(distinct, results))
+    return [normalized[text] for text in texts]
+
+
+def convert_to_lower_unicode_batch(texts: Iterable[str]) -> list[str]:
+    """
+    convert_to_lower_unicode on a list of texts (e.g. all the titles of a bib
+    file). Identical texts are converted once, and the lowercasing and the
+    removal of brackets run once for all of them.
+    """
+    return _normalize_batch(texts, _lower_unicode)
+
+
+def simplify_field_batch(texts: Iterable[str]) -> list[str]:
+    """
+    simplify_field on a list of texts, converting identical texts once (see
+    convert_to_lower_unicode_batch).
+    """
+    return _normalize_batch(texts, _simplify_unicode)
+
+
+# Start of a bibtex entry, "@type{" or "@type(". The type-agnostic group
+# numbers allow scanning both str and bytes.
+_ENTRY_START_RE = re.compile(r"@(\w+)\s*(?:(\{)|(\())")
+_ENTRY_START_RE_BYTES = re.compile(rb"@(\w+)\s*(?:(\{)|(\())")
+_ENTRY_DELIMITERS_RE = re.compile(r"(\{)|(\})")
+_ENTRY_DELIMITERS_RE_BYTES = re.compile(rb"(\{)|(\})")
+# The quotes and parentheses also count in the entries in parentheses
+_PARENTHESIS_ENTRY_DELIMITERS_RE = re.compile(r'(\{)|(\})|(")|(\()|(\))')
+_PARENTHESIS_ENTRY_DELIMITERS_RE_BYTES = re.compile(rb'(\{)|(\})|(")|(\()|(\))')
+
+
+def _balanced_braces_pattern(depth: int) -> str:
+    """
+    Returns a regular expression matching a group of balanced braces nested
+    up to depth levels. Used as fast path of the brace-depth scanners.
+    """
+    pattern = r"\{[^{}]*\}"
+    for _ in range(depth - 1):
+        pattern = r"\{[^{}]*(?:" + pattern + r"[^{}]*)*\}"
+    return pattern
+
+
+_BALANCED_ENTRY_RE = re.compile(_balanced_braces_pattern(5))
+_BALANCED_ENTRY_RE_BYTES = re.compile(_balanced_braces_pattern(5).encode())
+_FIELD_NAME_RE = re.compile(r"[\s,]*([^\s=,{}\"#%()]+)\s*=\s*")
+# The % comment lines between the fields
+_FIELD_COMMENTS_RE = re.compile(r"[\s,]*%[^\n]*(?:[\s,]*%[^\n]*)*")
+_FIELD_SEPARATORS_RE = re.compile(r"[\s,]*")
+_SIMPLE_FIELD_VALUE_RE = re.compile(
+    r'(?:{}|"[^"{{}}]*"|[^,{{}}"=]*)(?=\s*(?:,|\Z))'.format(
+        _balanced_braces_pattern(4)
+    )
+)
+_FIELD_DELIMITERS_RE = re.compile(r'(\{)|(\})|(")|(,)')
+# The name of the next field after a value without the comma, like
+# "title = {A} journal = {B}" or "year = 2020 month = jan"
+_NEXT_FIELD_RE = re.compile(r'\s*[^\s=,{}"#%()]+\s*=')
+_BARE_VALUE_BEFORE_FIELD_RE = re.compile(
+    r'[^\s,{}"#=]+(?=\s+[^\s=,{}"#%()]+\s*=)'
+)
+# Cleaning of the field values (see BibEntry.parse_entry)
+# Whitespace collapsed to a space, only in the values with newlines or
+# repeated spaces
+_FIELD_WHITESPACE_RE = re.compile(r"[\n\r ]{2,}|[\n\r]")
+_AUTHOR_INITIALS_RE = re.compile(r"\s+([A-Z]+)(\s|$)")
+
+
+def _find_entry_end(text: Union[str, bytes], pos: int, parenthesis: bool) -> int:
+    """
+    Returns the index of the brace (or parenthesis) closing the entry whose
+    content starts at pos, or -1 if the entry is not closed in text.
+
+    In an entry in parentheses, the parentheses outside braces and quoted
+    values are matched too, so "Water (ice) phases" does not close it.
+    """
+    if not parenthesis:
+        if isinstance(text, str):
+            delimiters = _ENTRY_DELIMITERS_RE
+        else:
+            delimiters = _ENTRY_DELIMITERS_RE_BYTES
+        depth = 0
+        for match in delimiters.finditer(text, pos):
+            if match.lastindex == 1:
+                depth += 1
+            elif depth == 0:
+                return match.start()
+            else:
+                depth -= 1
+        return -1
+
+    if isinstance(text, str):
+        delimiters = _PARENTHESIS_ENTRY_DELIMITERS_RE
+    else:
+        delimiters = _PARENTHESIS_ENTRY_DELIMITERS_RE_BYTES
+    depth = 0
+    parentheses = 0
+    quoted = False
+    for match in delimiters.finditer(text, pos):
+        delimiter = match.lastindex
+        if delimiter == 1:
+            depth += 1
+        elif delimiter == 2:
+            depth -= 1
+        elif depth > 0:
+            continue
+        elif delimiter == 3:
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif delimiter == 4:
+            parentheses += 1
+        elif parentheses == 0:
+            return match.start()
+        else:
+            parentheses -= 1
+    return -1
+
+
+def _entry_content_end(text: Union[str, bytes], match: re.Match) -> int:
+    """
+    Returns the index of the brace (or parenthesis) closing the entry started
+    by match (see _ENTRY_START_RE), or -1 if it is not closed in text.
+    """
+    if match.lastindex == 2:
+        balanced = (
+            _BALANCED_ENTRY_RE if isinstance(text, str) else _BALANCED_ENTRY_RE_BYTES
+        )
+        if body := balanced.match(text, match.end() - 1):
+            return body.end() - 1
+    return _find_entry_end(text, match.end(), match.lastindex == 3)
+
+
+def _scan_entries(text: Union[str, bytes], pos: int = 0):
+    """
+    Walks the bibtex entries in text, skipping the content between them.
+
+    Yields (entry_type, start, content_start, content_end) for each entry,
+    where start is the index of the "@" and the content is the text between
+    the braces (or parentheses) of the entry. Braces are matched, so an "@"
+    inside a field value does not start a new entry.
+    """
+    entry_start = _ENTRY_START_RE if isinstance(text, str) else _ENTRY_START_RE_BYTES
+    while (match := entry_start.search(text, pos)) is not None:
+        content_end = _entry_content_end(text, match)
+        if content_end < 0:
+            raise ValueError(
+                "Invalid bibtex entry: {!r}".format(text[match.start() :][:100])
+            )
+        yield match.group(1), match.start(), match.end(), content_end
+        pos = content_end + 1
+
+
+def _scan_stream(f: TextIO, chunk_size: int = 1 << 16):
+    """
+    Walks the bibtex entries of a file reading it in chunks.
+
+    Yields (text, entry_type, start, content_start, content_end) as
+    _scan_entries, where text is the buffer holding the entry. Only the
+    unfinished entry is kept between chunks.
+    """
+    buffer = ""
+    pos = 0
+    eof = False
+    while True:
+        match = _ENTRY_START_RE.search(buffer, pos)
+        content_end = -1 if match is None else _entry_content_end(buffer, match)
+        if content_end >= 0:
+            yield buffer, match.group(1), match.start(), match.end(), content_end
+            pos = content_end + 1
+            continue
+        if eof:
+            if match is not None:
+                raise ValueError(
+                    "Invalid bibtex entry: {!r}".format(buffer[match.start() :][:100])
+                )
+            return
+        # Keep the unfinished entry or the last "@", that may start one
+        keep = match.start() if match is not None else buffer.rfind("@", pos)
+        buffer = buffer[keep:] if keep >= 0 else ""
+        pos = 0
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+def _entry_key(text: str, content_start: int, content_end: int) -> tuple[str, int]:
+    """
+    Returns the key of the entry whose content is
+    text[content_start:content_end] and the index where the key ends.
+    """
+    key_end = text.find(",", content_start, content_end)
+    if key_end < 0:
+        key_end = content_end
+    return text[content_start:key_end].strip(), key_end
+
+
+def _parse_entry_text(
+    text: str, entry_type: str, content_start: int, content_end: int
+) -> "BibEntry":
+    """
+    Returns the BibEntry whose content (key and fields) is
+    text[content_start:content_end].
+    """
+    key, key_end = _entry_key(text, content_start, content_end)
+    entry = BibEntry(entry_type, key)
+    entry.parse_entry(text, key_end, content_end)
+    return entry
+
+
+def iter_entries(fname: str, chunk_size: int = 1 << 16) -> Iterator["BibEntry"]:
+    """
+    Yields the entries of a bib file one at a time.
+
+    The file is read in chunks, so only the current entry is kept in memory.
+    Useful to process bib files too large to be loaded in a BibFile, e.g.
+    to write a filtered copy:
+
+        with open("articles.bib", "w") as f:
+            for entry in iter_entries("library.bib"):
+                if entry.type.lower() == "article":
+                    f.write(str(entry) + ",\n\n")
+
+    Control entries are skipped.
+
+    Parameters
+    ----------
+    fname : str
+        The name of the bib file
+    chunk_size : int, optional
+        The number of characters read at once. Defaults to 65536.
+    """
+    with open(fname, "r") as f:
+        for text, entry_type, _, content_start, content_end in _scan_stream(
+            f, chunk_size
+        ):
+            if entry_type.lower() in ("control",):
+                continue
+            yield _parse_entry_text(text, entry_type, content_start, content_end)
+
+
+def _scan_fields(text: str, pos: int, end: int):
+    """
+    Walks the "name = value" fields of an entry in text[pos:end].
+
+    Yields (name, value_start, value_end) for each field. The value ends at
+    the first comma outside braces and quotes, or where the name of another
+    field starts if the comma is missing. The lines starting with % between
+    the fields are skipped.
+
+    Raises
+    ------
+    ValueError
+        If there is text that is not a field.
+    """
+    while True:
+        match = _FIELD_NAME_RE.match(text, pos, end)
+        if match is None:
+            if comments := _FIELD_COMMENTS_RE.match(text, pos, end):
+                pos = comments.end()
+                continue
+            break
+        if value := _SIMPLE_FIELD_VALUE_RE.match(text, match.end(), end):
+            yield match.group(1), match.end(), value.end()
+            pos = value.end()
+            continue
+        if value := _BARE_VALUE_BEFORE_FIELD_RE.match(text, match.end(), end):
+            yield match.group(1), match.end(), value.end()
+            pos = value.end()
+            continue
+        value_end = end
+        depth = 0
+        quoted = False
+        for delimiter in _FIELD_DELIMITERS_RE.finditer(text, match.end(), end):
+            if delimiter.lastindex == 1:
+                depth += 1
+                continue
+            if delimiter.lastindex == 2:
+                depth -= 1
+            elif depth:
+                continue
+            elif delimiter.lastindex == 3:
+                quoted = not quoted
+            elif not quoted:
+                value_end = delimiter.start()
+                break
+            # A value closed at depth 0 followed by a field name
+            if not depth and not quoted:
+                if _NEXT_FIELD_RE.match(text, delimiter.end(), end):
+                    value_end = delimiter.end()
+                    break
+        yield match.group(1), match.end(), value_end
+        pos = value_end
+    pos = _FIELD_SEPARATORS_RE.match(text, pos, end).end()
+    if pos < end:
+        raise ValueError("Invalid bibtex field: {!r}".format(text[pos:end][:100]))
+
+
+def _fields_similar(
+    fields1: dict[str, str],
+    fields2: dict[str, str],
+    surnames1: tuple[str, ...],
+    surnames2: tuple[str, ...],
+    n_similarities: int = 3,
+) -> bool:
+    """
+    Compares the simplified fields and author surnames of two entries as
+    BibEntry.is_similar does once it knows they are not equal.
+    """
+    similarities = 0
+    for field in fields1.keys() & fields2.keys():
+        if fields1[field] == fields2[field]:
+            similarities += 1
+        # Special quick checks that restrict the number of comparisons
+        elif field in ("volume", "number", "year"):
+            return False
+        # Authors are tricky H. William can be the same as Humayun William
+        # We only check the last name
+        elif field == "author":
+            if len(surnames1) != len(surnames2):
+                return False
+            similarities += surnames1 == surnames2
+    return similarities >= n_similarities
+
+
+def _profiles_similar(
+    profile1: tuple, profile2: tuple, n_similarities: int = 3
+) -> bool:
+    """
+    BibEntry.is_similar on the profiles returned by
+    BibEntry.similarity_profile.
+    """
+    eq_keys1, fields1, surnames1 = profile1
+    eq_keys2, fields2, surnames2 = profile2
+    if not eq_keys1.isdisjoint(eq_keys2):
+        return True
+    return _fields_similar(fields1, fields2, surnames1, surnames2, n_similarities)
+
+
+def _similarity_block_keys(profile: tuple) -> set[tuple]:
+    """
+    BibEntry.similarity_block_keys of the profile returned by
+    BibEntry.similarity_profile.
+    """
+    eq_keys, fields, surnames = profile
+    block_keys = set(eq_keys)
+    strong, weak = [], []
+    for field in SIMILARITY_BLOCKING_FIELDS:
+        if field not in fields:
+            continue
+        # is_similar only compares the first word of each author
+        value = (field, surnames if field == "author" else fields[field])
+        if field in SIMILARITY_WEAK_FIELDS:
+            weak.append(value)
+        else:
+            strong.append(value)
+    block_keys.update(itertools.combinations(strong, 2))
+    block_keys.update((value, other) for value in strong for other in weak)
+    block_keys.update(itertools.combinations(weak, 3))
+    return block_keys
+
+
+def _block_index(
+    block_keys: list[set[tuple]],
+) -> tuple[list[list[int]], list[frozenset[int]]]:
+    """
+    Indexes the blocking keys of some entries.
+
+    Returns the buckets of the keys shared by more than one entry (sorted
+    lists of indices of the entries) and, for each entry, the positions of
+    its buckets in that list.
+    """
+    index: dict[tuple, list[int]] = {}
+    for i, keys in enumerate(block_keys):
+        for key in keys:
+            index.setdefault(key, []).append(i)
+    buckets = [bucket for bucket in index.values() if len(bucket) > 1]
+    entry_buckets = [[] for _ in block_keys]
+    for bucket_id, bucket in enumerate(buckets):
+        for i in bucket:
+            entry_buckets[i].append(bucket_id)
+    return buckets, [frozenset(ids) for ids in entry_buckets]
+
+
+def _bucket_pairs(
+    bucket_id: int, bucket: list[int], entry_buckets: Any
+) -> Iterator[tuple[int, int]]:
+    """
+    Yields the (i, j) pairs, with i < j, of the entries of a bucket returned by
+    _block_index whose first shared bucket is this one, so that each pair is
+    only yielded once.
+    """
+    for position, i in enumerate(bucket):
+        buckets_i = entry_buckets[i]
+        for j in bucket[position + 1 :]:
+            if min(buckets_i & entry_buckets[j]) == bucket_id:
+                yield i, j
+
+
+def _normalize_entries(entries: list["BibEntry"], simplified: bool = False):
+    """
+    Computes the equality keys (and the simplified fields if simplified) of
+    the entries that do not have them cached, normalizing the values of all
+    of them in one batch (see convert_to_lower_unicode_batch and
+    simplify_field_batch).
+    """
+
+    def pending(name: str) -> list["BibEntry"]:
+        # Only _Fields keep the normalized values
+        return [
+            entry
+            for entry in entries
+            if isinstance(entry.fields, _Fields)
+            and (
+                entry.fields.normalized is None
+                or name not in entry.fields.normalized
+            )
+        ]
+
+    to_normalize = pending("equality_keys")
+    titles = [
+        entry.fields["title"].lower()
+        for entry in to_normalize
+        if entry.fields.get("title")
+    ]
+    lower_unicode = dict(zip(titles, convert_to_lower_unicode_batch(titles)))
+    for entry in to_normalize:
+        entry._normalized(
+            "equality_keys",
+            lambda entry: entry._compute_equality_keys(lower_unicode.__getitem__),
+        )
+    if not simplified:
+        return
+
+    to_normalize = pending("simplified")
+    values = [
+        value
+        for entry in to_normalize
+        for field, value in entry.fields.items()
+        if field not in ("volume", "number", "year") and value.strip()
+    ]
+    simplify = dict(zip(values, simplify_field_batch(values)))
+    for entry in to_normalize:
+        entry._normalized(
+            "simplified",
+            lambda entry: entry._compute_simplified_fields(simplify.__getitem__),
+        )
+
+
+def _similarity_profiles(
+    entries: list[tuple[str, dict[str, str]]], block_keys: bool = False
+) -> tuple[list[tuple], list[set[tuple]]]:
+    """
+    Computes the similarity profiles of (id_key, fields) pairs in a worker,
+    and their blocking keys if block_keys (or None).
+    """
+    bib_entries = []
+    for id_key, fields in entries:
+        entry = BibEntry("", id_key)
+        entry.fields = _Fields(fields)
+        bib_entries.append(entry)
+    _normalize_entries(bib_entries, simplified=True)
+    profiles = [entry.similarity_profile() for entry in bib_entries]
+    if not block_keys:
+        return profiles, None
+    return profiles, [_similarity_block_keys(profile) for profile in profiles]
+
+
+# The file read by the worker and its content (see _similar_in_chunk)
+_WORKER_DATA: tuple[str, Any] = ("", None)
+
+
+def _similar_in_chunk(
+    fname: str, chunk: Any, n_similarities: int
+) -> list[tuple[int, int]]:
+    """
+    Returns the similar pairs of a chunk of the scan run in a worker.
+
+    fname is a file with the marshalled profiles of the entries and the
+    positions of their buckets (see _block_index), which the worker only
+    reads once. The chunk is either a (start, stop) range of rows, compared
+    with all the following entries, or a list of (bucket_id, bucket) tuples
+    whose pairs are compared (see _bucket_pairs).
+    """
+    global _WORKER_DATA
+    if _WORKER_DATA[0] != fname:
+        with open(fname, "rb") as f:
+            _WORKER_DATA = (fname, marshal.load(f))
+    profiles, entry_buckets = _WORKER_DATA[1]
+    if isinstance(chunk, range):
+        pairs = ((i, j) for i in chunk for j in range(i + 1, len(profiles)))
+    else:
+        pairs = (
+            pair
+            for bucket_id, bucket in chunk
+            for pair in _bucket_pairs(bucket_id, bucket, entry_buckets)
+        )
+    return [
+        (i, j)
+        for i, j in pairs
+        if _profiles_similar(profiles[i], profiles[j], n_similarities)
+    ]
+
+
+def _parse_bib_file(fname: str) -> bytes:
+    """
+    Parses a bib file in a worker. Returns the marshalled non entry lines and
+    (key, type, id_key, fields) tuples of the entries, which keeps the field
+    names interned.
+    """
+    bib_file = BibFile(fname)
+    entries = [
+        (key, entry.type, entry.id_key, dict(entry.fields))
+        for key, entry in bib_file.bib_entries.items()
+    ]
+    return marshal.dumps((bib_file.non_entry_lines, entries))
+
+
+def _load_parsed_bib_file(fname: str, data: bytes) -> "BibFile":
+    """
+    Returns the BibFile parsed by _parse_bib_file.
+    """
+    non_entry_lines, entries = marshal.loads(data)
+    bib_file = BibFile()
+    bib_file.fname = fname
+    bib_file.non_entry_lines = non_entry_lines
+    for key, entry_type, id_key, fields in entries:
+        entry = BibEntry(entry_type, id_key)
+        entry.fields = _Fields(fields)
+        bib_file.bib_entries[key] = entry
+    return bib_file
+
+
+def _common_prefix_length(text1: str, text2: str, block: int = 1 << 16) -> int:
+    """
+    Returns the length of the common prefix of two strings. The strings are
+    compared in blocks, so the comparisons run in C.
+    """
+    n = min(len(text1), len(text2))
+    start = 0
+    while start < n and text1[start : start + block] == text2[start : start + block]:
+        start += block
+    if start >= n:
+        return n
+    low, high = start, min(start + block, n)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if text1[low:middle] == text2[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix_length(
+    text1: str, text2: str, limit: int, block: int = 1 << 16
+) -> int:
+    """
+    Returns the length of the common suffix of two strings, up to limit.
+    """
+    n1, n2 = len(text1), len(text2)
+    end = 0
+    while end < limit:
+        size = min(end + block, limit)
+        if text1[n1 - size : n1 - end] != text2[n2 - size : n2 - end]:
+            break
+        end = size
+    if end >= limit:
+        return limit
+    low, high = end, min(end + block, limit)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if text1[n1 - middle : n1 - low] == text2[n2 - middle : n2 - low]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class BibUpdate(NamedTuple):
+    """
+    Keys of the entries that changed in a bib file (see BibFile.reload).
+    """
+
+    added: list[str]
+    removed: list[str]
+    modified: list[str]
+
+
+class MergeConflict(NamedTuple):
+    """
+    A duplicate key found merging bib files (see BibFile.merge_all).
+
+    action is what the conflict policy did with the entry being added:
+    "merge" (merged with the entry already stored), "rename" (added with
+    another key), "keep" (discarded) or "replace" (stored instead of the
+    previous one). new_key is the key under which the entry was stored, or
+    None if it was discarded.
+    """
+
+    key: str
+    fname: str
+    action: str
+    new_key: str
+
+
+def default_conflict_policy(key: str, entry: "BibEntry", other: "BibEntry") -> str:
+    """
+    Conflict policy of BibFile.__add__: the entries with the same key are
+    merged if they are equal (see BibEntry.__eq__) and the added one is
+    renamed otherwise.
+
+    A conflict policy is called with the duplicate key, the entry already
+    stored and the entry being added, and returns "merge", "rename", "keep"
+    or "replace" (see MergeConflict).
+    """
+    return "merge" if other == entry else "rename"
+
+
+class _BibSource:
+    """
+    Content of a parsed bib file and the location of its entries, used to
+    reload it (see BibFile.reload).
+
+    The entries are stored in parallel lists, so that they can be shifted and
+    rebuilt without Python loops. The key and entry of control entries are
+    None.
+    """
+
+    __slots__ = ("content", "starts", "ends", "keys", "entries")
+
+    def __init__(
+        self,
+        content: str,
+        starts: list[int] = None,
+        ends: list[int] = None,
+        keys: list[str] = None,
+        entries: list["BibEntry"] = None,
+    ):
+        self.content = content
+        self.starts = [] if starts is None else starts
+        self.ends = [] if ends is None else ends
+        self.keys = [] if keys is None else keys
+        self.entries = [] if entries is None else entries
+
+    def append(self, start: int, end: int, key: str, entry: "BibEntry"):
+        self.starts.append(start)
+        self.ends.append(end)
+        self.keys.append(key)
+        self.entries.append(entry)
+
+    def update_bib_entries(self, bib_entries: dict[str, "BibEntry"]):
+        """
+        Adds the entries (but not the control ones) to bib_entries.
+        """
+        bib_entries.update(zip(self.keys, self.entries))
+        bib_entries.pop(None, None)
+
+    def control_lines(self) -> list[str]:
+        """
+        Returns the text of the control entries up to the next entry.
+        """
+        lines = []
+        i = -1
+        while True:
+            try:
+                i = self.keys.index(None, i + 1)
+            except ValueError:
+                return lines
+            end = self.starts[i + 1] if i + 1 < len(self.starts) else len(self.content)
+            lines.append(self.content[self.starts[i] : end])
+
+
+class _LazyBibEntries(MutableMapping):
+    """
+    Mapping of bib entries that are parsed the first time they are accessed.
+
+    Until then, the mapping stores the arguments of the load function that
+    returns the BibEntry (e.g. its location in the bib file).
+    """
+
+    def __init__(self, load, data: dict = None):
+        self._load = load
+        self._data = {} if data is None else data
+
+    def __getitem__(self, key: str) -> "BibEntry":
+        value = self._data[key]
+        if not isinstance(value, BibEntry):
+            value = self._data[key] = self._load(value)
+        return value
+
+    def __setitem__(self, key: str, value: "BibEntry"):
+        self._data[key] = value
+
+    def __delitem__(self, key: str):
+        del self._data[key]
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def copy(self) -> "_LazyBibEntries":
+        return _LazyBibEntries(self._load, self._data.copy())
+
+
+class _IndexedEntries(dict):
+    """
+    Dict of bib entries with an index of their equality keys (see
+    BibEntry.equality_keys), used to find the entries equal to a given one
+    without comparing it with all of them (see BibFile.get_key_entry).
+
+    The index is built the first time it is used and then kept up to date as
+    entries are set or removed. The fields of the indexed entries report to
+    the index when they are modified in place or replaced (see
+    _Fields.watch), and those entries are indexed again before the next
+    lookup. The entries whose fields are not _Fields are checked at every
+    lookup. Entries renamed in place (their id_key) must be set again.
+    """
+
+    __slots__ = (
+        "_index",
+        "_entry_keys",
+        "_fields_keys",
+        "_modified",
+        "_unwatched",
+        "_positions",
+        "_next_position",
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._index: dict[tuple[str, str], set[str]] = None
+        # The equality keys indexed for each key, with the fields they come
+        # from, and the keys indexed with each _Fields (by id)
+        self._entry_keys: dict[str, tuple[set[tuple[str, str]], dict]] = {}
+        self._fields_keys: dict[int, set[str]] = {}
+        # The _Fields modified since they were indexed (by id), and the keys
+        # of the entries whose fields cannot report it
+        self._modified: dict[int, _Fields] = {}
+        self._unwatched: set[str] = set()
+        # The position of each key in the dict
+        self._positions: dict[str, int] = {}
+        self._next_position = 0
+
+    def _build_index(self):
+        _normalize_entries(list(self.values()))
+        self._index = {}
+        for key, entry in self.items():
+            self._index_entry(key, entry)
+
+    def _index_entry(self, key: str, entry: "BibEntry"):
+        if key not in self._positions:
+            self._positions[key] = self._next_position
+            self._next_position += 1
+        eq_keys = entry.equality_keys()
+        fields = entry.fields
+        self._entry_keys[key] = (eq_keys, fields)
+        for eq_key in eq_keys:
+            self._index.setdefault(eq_key, set()).add(key)
+        if isinstance(fields, _Fields):
+            self._fields_keys.setdefault(id(fields), set()).add(key)
+            fields.watch(self._modified)
+        else:
+            self._unwatched.add(key)
+
+    def _unindex_entry(self, key: str):
+        eq_keys, fields = self._entry_keys.pop(key)
+        for eq_key in eq_keys:
+            keys = self._index[eq_key]
+            keys.discard(key)
+            if not keys:
+                del self._index[eq_key]
+        if isinstance(fields, _Fields):
+            keys = self._fields_keys[id(fields)]
+            keys.discard(key)
+            if not keys:
+                del self._fields_keys[id(fields)]
+                fields.unwatch(self._modified)
+        else:
+            self._unwatched.discard(key)
+
+    def _reindex_modified(self):
+        """
+        Indexes again the entries whose fields have been modified in place or
+        replaced.
+        """
+        modified = set()
+        while self._modified:
+            fields_id, _ = self._modified.popitem()
+            modified.update(self._fields_keys.get(fields_id, ()))
+        for key in self._unwatched:
+            if self[key].equality_keys() != self._entry_keys[key][0]:
+                modified.add(key)
+        if not modified:
+            return
+        _normalize_entries([self[key] for key in modified])
+        for key in modified:
+            self._unindex_entry(key)
+            self._index_entry(key, self[key])
+
+    def find_equal(self, entry: "BibEntry", key: str) -> str:
+        """
+        Returns the first key, other than key, of an entry equal to entry, or
+        None if there is none.
+        """
+        if self._index is None:
+            self._build_index()
+        else:
+            self._reindex_modified()
+        found = None
+        for eq_key in entry.equality_keys():
+            for key2 in self._index.get(eq_key, ()):
+                if key2 != key and (
+                    found is None or self._positions[key2] < self._positions[found]
+                ):
+                    found = key2
+        return found
+
+    def __setitem__(self, key: str, entry: "BibEntry"):
+        if self._index is not None:
+            if key in self:
+                self._unindex_entry(key)
+            self._index_entry(key, entry)
+        super().__setitem__(key, entry)
+
+    def __delitem__(self, key: str):
+        super().__delitem__(key)
+        if self._index is not None:
+            self._unindex_entry(key)
+            del self._positions[key]
+
+    def pop(self, key: str, *default) -> "BibEntry":
+        if key not in self:
+            return super().pop(key, *default)
+        entry = self[key]
+        del self[key]
+        return entry
+
+    def popitem(self) -> tuple[str, "BibEntry"]:
+        key, entry = super().popitem()
+        if self._index is not None:
+            self._unindex_entry(key)
+            del self._positions[key]
+        return key, entry
+
+    def setdefault(self, key: str, default: "BibEntry" = None) -> "BibEntry":
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        if self._index is None:
+            super().update(*args, **kwargs)
+        else:
+            for key, entry in dict(*args, **kwargs).items():
+                self[key] = entry
+
+    def __ior__(self, other) -> "_IndexedEntries":
+        self.update(other)
+        return self
+
+    def clear(self):
+        super().clear()
+        for _, fields in self._entry_keys.values():
+            if isinstance(fields, _Fields):
+                fields.unwatch(self._modified)
+        self._index = None
+        self._entry_keys = {}
+        self._fields_keys = {}
+        self._modified = {}
+        self._unwatched = set()
+        self._positions = {}
+        self._next_position = 0
+
+    def copy(self) -> "_IndexedEntries":
+        return _IndexedEntries(self)
+
+    def __reduce__(self):
+        # The index is not pickled. Unpickling the items with __setitem__
+        # would need the slots, which are set by __init__
+        return _IndexedEntries, (dict(self),)
+
+
+class BibFile:
+    """
+    Class to manage the bibliography entries in a .bib file
+
+    Parameters
+    ----------
+    fname : str
+        The name of the bib file
+    lazy : bool, optional
+        If True, the file is memory-mapped and only the keys of the entries
+        are read. Each entry is parsed the first time it is accessed. Useful
+        for large bib files of which only a few entries are used. Defaults to
+        False.
+    cache_dir : str, optional
+        If given, the parsed entries are stored in a file in this directory
+        and loaded from it the next time the bib file is read, unless the
+        bib file has changed. Ignored if lazy is True. Defaults to None.
+
+    Attributes
+    ----------
+    bib_entries : dict[str, BibEntry]
+        The bibliography entries in the bib file. A dict assigned to it is
+        kept as is, but only the dicts created by BibFile index the entries
+        to find the equal ones (see get_key_entry).
+    non_entry_lines : list[str]
+        The lines that are not bib entries (usually header lines)
+    merge_conflicts : list[MergeConflict]
+        The duplicate keys found merging bib files into this one (see
+        merge_all).
+
+    """
+
+    def __init__(self, fname: str = None, lazy: bool = False, cache_dir: str = None):
+        self.bib_entries: dict[str, "BibEntry"] = _IndexedEntries()
+        self.non_entry_lines: list[str] = []
+        self.merge_conflicts: list[MergeConflict] = []
+        self.fname = fname
+        # Content and location of the entries of the parsed file, for reload
+        self._source: _BibSource = None
+        if self.fname is not None:
+            if lazy:
+                self.index_bib()
+            else:
+                self.parse_bib(cache_dir)
+
+    def __getitem__(self, key: str) -> "BibEntry":
+        return self.bib_entries[key]
+
+    def __repr__(self):
+        return "Bib file: {}".format(self.fname)
+
+    def __str__(self):
+        final_str = "".join(self.non_entry_lines)
+        return final_str + ",\n\n".join(
+            str(entry) for entry in self.bib_entries.values()
+        )
+
+    def __add__(self, other: "BibFile") -> "BibFile":
+        new_bib = BibFile()
+        new_bib.non_entry_lines = self.non_entry_lines + other.non_entry_lines
+        new_bib.bib_entries = self.bib_entries.copy()
+        conflicts = new_bib._merge_entries(other, default_conflict_policy)
+        new_bib.merge_conflicts = (
+            self.merge_conflicts + other.merge_conflicts + conflicts
+        )
+        for conflict in conflicts:
+            text = "Warning: duplicate key {} adding {} and {}.".format(
+                conflict.key, repr(new_bib), repr(other)
+            )
+            if conflict.action == "merge":
+                print(text + "The entries seem to be the same. Merging")
+            else:
+                print(
+                    text
+                    + "The entries seem to be different. Adding both with keys {} and {}. CHECK THIS ENTRY".format(
+                        conflict.key, conflict.new_key
+                    )
+                )
+        return new_bib
+
+    def _merge_entries(
+        self, other: "BibFile", policy, copy_indices: dict[str, int] = None
+    ) -> list[MergeConflict]:
+        """
+        Adds the entries of other to this bib file, solving the duplicate keys
+        with policy (see default_conflict_policy). Returns the conflicts.
+
+        The renamed entries get the key with "Copy" and the first free index
+        appended. copy_indices keeps the next index to try for each key, so
+        that it is not searched from 1 again. It can be shared by consecutive
+        merges into the same bib file, as long as no entry is removed.
+        """
+        bib_entries = self.bib_entries
+        if copy_indices is None:
+            copy_indices = {}
+        other_entries = other.bib_entries
+        # Entries of lazy bib files loaded in the same way are moved unloaded
+        lazy = (
+            isinstance(other_entries, _LazyBibEntries)
+            and isinstance(bib_entries, _LazyBibEntries)
+            and other_entries._load == bib_entries._load
+        )
+        conflicts = []
+        for key in other_entries:
+            if key not in bib_entries:
+                if lazy:
+                    bib_entries._data[key] = other_entries._data[key]
+                else:
+                    bib_entries[key] = other_entries[key]
+                continue
+            value = other_entries[key]
+            action = policy(key, bib_entries[key], value)
+            if action == "merge":
+                new_entry = value.merge(bib_entries[key])
+                new_key = new_entry.id_key
+                bib_entries[new_key] = new_entry
+            elif action == "rename":
+                new_key = key + "Copy"
+                index = copy_indices.get(new_key, 1)
+                while new_key + str(index) in bib_entries:
+                    index += 1
+                copy_indices[new_key] = index + 1
+                new_key += str(index)
+                bib_entries[new_key] = value
+            elif action == "replace":
+                new_key = key
+                bib_entries[key] = value
+            elif action == "keep":
+                new_key = None
+            else:
+                raise ValueError("Unknown conflict policy action {}".format(action))
+            conflicts.append(MergeConflict(key, other.fname, action, new_key))
+        return conflicts
+
+    @classmethod
+    def from_many(
+        cls, fnames: Iterable[str], workers: int = 1, policy: Callable = None
+    ) -> "BibFile":
+        """
+        Parses several bib files and merges them (see merge_all).
+
+        Parameters
+        ----------
+        fnames : Iterable[str]
+            The names of the bib files, in the order they are merged.
+        workers : int, optional
+            The number of processes parsing the files. Defaults to 1, which
+            parses them in this process.
+        policy : Callable, optional
+            The conflict policy of merge_all. Defaults to
+            default_conflict_policy, the behaviour of __add__.
+
+        Returns
+        -------
+        merged : BibFile
+            The merged bib file, with the conflicts in merge_conflicts.
+        """
+        fnames = list(fnames)
+        if workers <= 1:
+            return cls.merge_all((cls(fname) for fname in fnames), policy)
+        with ProcessPoolExecutor(workers) as executor:
+            # map returns the results in order, so the merge is deterministic
+            parsed = executor.map(_parse_bib_file, fnames)
+            return cls.merge_all(
+                (
+                    _load_parsed_bib_file(fname, data)
+                    for fname, data in zip(fnames, parsed)
+                ),
+                policy,
+            )
+
+    @classmethod
+    def merge_all(
+        cls, bib_files: Iterable["BibFile"], policy: Callable = None
+    ) -> "BibFile":
+        """
+        Merges bib files into a new one, with the same result as adding them
+        (sum(bib_files)) but in a single pass, without copying the entries
+        merged so far for each file.
+
+        Parameters
+        ----------
+        bib_files : Iterable[BibFile]
+            The bib files to merge, in order.
+        policy : Callable, optional
+            The function that decides what to do when a key is already in the
+            merged entries (see default_conflict_policy). Defaults to
+            default_conflict_policy, the behaviour of __add__.
+
+        Returns
+        -------
+        merged : BibFile
+            The merged bib file. Its merge_conflicts list the duplicate keys
+            found and what was done with them, instead of printing warnings.
+        """
+        if policy is None:
+            policy = default_conflict_policy
+        merged = cls()
+        copy_indices = {}
+        for bib_file in bib_files:
+            merged.non_entry_lines.extend(bib_file.non_entry_lines)
+            merged.merge_conflicts.extend(
+                merged._merge_entries(bib_file, policy, copy_indices)
+            )
+        return merged
+
+    def renamed_keys(self) -> dict[str, dict[str, str]]:
+        """
+        Returns the keys of the entries renamed merging bib files into this
+        one (see merge_conflicts).
+
+        Returns
+        -------
+        renamed_keys : dict[str, dict[str, str]]
+            For the name of each bib file with renamed entries, their
+            original keys and the keys in this bib file. Useful to adapt the
+            latex files that cite that bib file with the replace_cite_entries
+            method.
+        """
+        renamed_keys: dict[str, dict[str, str]] = {}
+        for conflict in self.merge_conflicts:
+            if conflict.action == "rename":
+                renamed_keys.setdefault(conflict.fname, {})[
+                    conflict.key
+                ] = conflict.new_key
+        return renamed_keys
+
+    def __radd__(self, other: Any) -> "BibFile":
+        if not other:
+            return self
+        else:
+            raise ValueError("Cannot add bib files to {}".format(repr(other)))
+
+    def parse_bib(self, cache_dir: str = None):
+        """
+        Extract the bibliography entries from a bibtex file
+
+        If cache_dir is given, the entries are loaded from the cache file of
+        the bib file in that directory if its path, size, modification time
+        and content have not changed. Otherwise, the file is parsed and the
+        cache file is written.
+        """
+        with open(self.fname, "r") as f:
+            content = f.read()
+        if cache_dir is None:
+            self._source = self._add_entries(content)
+            return
+
+        stat = os.stat(self.fname)
+        path = os.path.abspath(self.fname)
+        header = (
+            _CACHE_VERSION,
+            sys.version_info[:2],
+            path,
+            stat.st_size,
+            stat.st_mtime_ns,
+            hashlib.blake2b(content.encode("utf-8", "surrogatepass")).digest(),
+        )
+        cache_file = os.path.join(
+            cache_dir, hashlib.sha1(path.encode()).hexdigest() + ".bibcache"
+        )
+        if self._load_cache(cache_file, header, content):
+            return
+        self._source = self._add_entries(content)
+        self._write_cache(cache_file, header)
+
+    def _load_cache(self, cache_file: str, header: tuple, content: str) -> bool:
+        """
+        Loads the entries from the cache file if it was written with the same
+        header. Returns whether they were loaded.
+        """
+        try:
+            with open(cache_file, "rb") as f:
+                cached_header, starts, ends, keys, entries = marshal.loads(f.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return False
+        if cached_header != header:
+            return False
+        for i, key in enumerate(keys):
+            if key is not None:
+                entry_type, fields = entries[i]
+                entries[i] = BibEntry(entry_type, key)
+                entries[i].fields = _Fields(fields)
+        self._source = _BibSource(content, starts, ends, keys, entries)
+        self._source.update_bib_entries(self.bib_entries)
+        self.non_entry_lines.extend(self._source.control_lines())
+        return True
+
+    def _write_cache(self, cache_file: str, header: tuple):
+        """
+        Writes the entries to the cache file. The file is replaced atomically,
+        so a cache file is never read half written.
+        """
+        cache_dir = os.path.dirname(cache_file)
+        source = self._source
+        entries = [
+            None if entry is None else (entry.type, dict(entry.fields))
+            for entry in source.entries
+        ]
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "wb", dir=cache_dir, suffix=".tmp", delete=False
+            ) as f:
+                f.write(
+                    marshal.dumps(
+                        (header, source.starts, source.ends, source.keys, entries)
+                    )
+                )
+            os.replace(f.name, cache_file)
+        except OSError as error:
+            print("Warning: cannot write the cache of {}: {}".format(self, error))
+
+    def index_bib(self):
+        """
+        Index the bibliography entries of a bibtex file without parsing them.
+
+        The file is memory-mapped and bib_entries only stores the location of
+        each entry until it is accessed.
+        """
+        with open(self.fname, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        index = {}
+        control_start = None
+        for entry_type, start, content_start, content_end in _scan_entries(
+            self._mmap
+        ):
+            if control_start is not None:
+                self.non_entry_lines.append(
+                    self._mmap[control_start:start].decode("utf-8")
+                )
+                control_start = None
+            if entry_type.lower() in (b"control",):
+                control_start = start
+                continue
+            key_end = self._mmap.find(b",", content_start, content_end)
+            if key_end < 0:
+                key_end = content_end
+            key = self._mmap[content_start:key_end].decode("utf-8").strip()
+            index[key] = (entry_type, content_start, content_end)
+        if control_start is not None:
+            self.non_entry_lines.append(self._mmap[control_start:].decode("utf-8"))
+        self.bib_entries = _LazyBibEntries(self._load_entry, index)
+
+    def _load_entry(self, location: tuple[bytes, int, int]) -> "BibEntry":
+        """
+        Parses the entry at the location in the memory-mapped file given by
+        index_bib.
+        """
+        entry_type, content_start, content_end = location
+        text = self._mmap[content_start:content_end].decode("utf-8")
+        return _parse_entry_text(text, entry_type.decode("utf-8"), 0, len(text))
+
+    def parse_entry(self, entry: str):
+        """
+        Initialize a bib entry from its corresponding string in the bib file.
+        """
+        if not self._add_entries("@" + entry).starts:
+            raise ValueError("Invalid bibtex entry: {}".format(entry))
+
+    def _add_entries(self, text: str) -> _BibSource:
+        """
+        Adds the entries in text in a single pass and returns their location.
+
+        The control entries, with the text up to the next entry, are added to
+        the non entry lines.
+        """
+        source = _BibSource(text)
+        for entry_type, start, content_start, content_end in _scan_entries(text):
+            if entry_type.lower() in ("control",):
+                source.append(start, content_end + 1, None, None)
+                continue
+            entry = _parse_entry_text(text, entry_type, content_start, content_end)
+            self.bib_entries[entry.id_key] = entry
+            source.append(start, content_end + 1, entry.id_key, entry)
+        self.non_entry_lines.extend(source.control_lines())
+        return source
+
+    def reload(self) -> BibUpdate:
+        """
+        Updates the entries after the bib file has changed.
+
+        Only the region of the file between the unchanged beginning and end is
+        parsed again, and the entries whose text has not changed are kept. The
+        entries and non entry lines are then the same as if the file was
+        parsed again, so changes made to bib_entries after parsing are lost.
+
+        Returns
+        -------
+        update : BibUpdate
+            The keys of the entries added, removed and modified in the file.
+        """
+        if isinstance(self.bib_entries, _LazyBibEntries):
+            raise ValueError("Cannot reload lazy bib file {}".format(repr(self)))
+        with open(self.fname, "r") as f:
+            content = f.read()
+        old = self._source or _BibSource("")
+
+        prefix = _common_prefix_length(old.content, content)
+        suffix = _common_suffix_length(
+            old.content, content, min(len(old.content), len(content)) - prefix
+        )
+        shift = len(content) - len(old.content)
+        # The entries before head and from tail on are in the unchanged text
+        head = bisect.bisect_left(old.starts, prefix)
+        if head and old.ends[head - 1] > prefix:
+            head -= 1
+        tail = max(head, bisect.bisect_left(old.starts, len(old.content) - suffix))
+
+        # Scan from the end of the head until an entry starts where an entry
+        # of the tail was, the rest of the file is the same
+        region = _BibSource(content)
+        scanned = []
+        pos = old.ends[head - 1] if head else 0
+        for entry_type, start, content_start, content_end in _scan_entries(
+            content, pos
+        ):
+            while tail < len(old.starts) and old.starts[tail] + shift < start:
+                tail += 1
+            if tail < len(old.starts) and old.starts[tail] + shift == start:
+                break
+            scanned.append((entry_type, start, content_start, content_end))
+        else:
+            tail = len(old.starts)
+
+        old_region = {
+            old.keys[i]: (old.content[old.starts[i] : old.ends[i]], old.entries[i])
+            for i in range(head, tail)
+            if old.keys[i] is not None
+        }
+        new_region = {}
+        for entry_type, start, content_start, content_end in scanned:
+            end = content_end + 1
+            if entry_type.lower() in ("control",):
+                region.append(start, end, None, None)
+                continue
+            key, _ = _entry_key(content, content_start, content_end)
+            new_region[key] = content[start:end]
+            old_text, entry = old_region.get(key, (None, None))
+            if old_text != new_region[key]:
+                entry = _parse_entry_text(
+                    content, entry_type, content_start, content_end
+                )
+            region.append(start, end, key, entry)
+        update = BibUpdate(
+            [key for key in new_region if key not in old_region],
+            [key for key in old_region if key not in new_region],
+            [
+                key
+                for key, text in new_region.items()
+                if key in old_region and old_region[key][0] != text
+            ],
+        )
+
+        source = _BibSource(
+            content,
+            old.starts[:head] + region.starts + [i + shift for i in old.starts[tail:]],
+            old.ends[:head] + region.ends + [i + shift for i in old.ends[tail:]],
+            old.keys[:head] + region.keys + old.keys[tail:],
+            old.entries[:head] + region.entries + old.entries[tail:],
+        )
+        self.bib_entries.clear()
+        source.update_bib_entries(self.bib_entries)
+        self.non_entry_lines = source.control_lines()
+        self._source = source
+        return update
+
+    def find_duplicated_entries(self) -> list[list[str]]:
+        """
+        Find duplicated entries in the bib file checking the title, doi and issbn.
+
+        The entries are indexed by the values compared in BibEntry.__eq__, so
+        only entries sharing one of them are compared. Each group contains the
+        first entry not yet grouped and every later entry equal to it, in the
+        order of the bib file.
+        """
+        keys, values = list(self.bib_entries.keys()), list(self.bib_entries.values())
+        _normalize_entries(values)
+        entry_keys = [value.equality_keys() for value in values]
+        index: dict[tuple[str, str], list[int]] = {}
+        for i, eq_keys in enumerate(entry_keys):
+            for eq_key in eq_keys:
+                index.setdefault(eq_key, []).append(i)
+
+        duplicated = []
+        grouped = [False] * len(values)
+        for i, eq_keys in enumerate(entry_keys):
+            if grouped[i]:
+                continue
+            aux = {i}
+            for eq_key in eq_keys:
+                # Every entry in the bucket is equal to i, so the bucket is
+                # exhausted once it has been visited.
+                bucket = index.pop(eq_key, ())
+                aux.update(j for j in bucket if j > i and not grouped[j])
+            for j in aux:
+                grouped[j] = True
+            if len(aux) > 1:
+                duplicated.append(sorted(aux))
+        return [[keys[i] for i in aux] for aux in duplicated]
+
+    def iter_similar_candidates(self) -> Iterator[tuple[int, int]]:
+        """
+        Yields the pairs of entries that may be similar (see
+        BibEntry.is_similar).
+
+        Only the entries sharing a blocking key (see
+        BibEntry.similarity_block_keys) are paired instead of comparing all of
+        them. The pairs are (i, j) tuples, with i < j, of indices of the
+        entries in bib_entries. They are yielded bucket by bucket, each one
+        from the first bucket shared by both entries, so they are not sorted
+        and are never held in memory together. Use similar_candidates_recall
+        to estimate how many similar pairs are missed.
+        """
+        entries = list(self.bib_entries.values())
+        _normalize_entries(entries, simplified=True)
+        buckets, entry_buckets = _block_index(
+            [entry.similarity_block_keys() for entry in entries]
+        )
+        for bucket_id, bucket in enumerate(buckets):
+            yield from _bucket_pairs(bucket_id, bucket, entry_buckets)
+
+    def similar_candidates(self) -> list[tuple[int, int]]:
+        """
+        Returns the sorted pairs of entries yielded by iter_similar_candidates.
+        """
+        return sorted(self.iter_similar_candidates())
+
+    def similar_candidates_recall(
+        self, sample_size: int = 100, seed: int = 0
+    ) -> dict[str, float]:
+        """
+        Estimates the recall of similar_candidates against brute force.
+
+        A random sample of entries is compared with every other entry of the
+        bib file with BibEntry.is_similar, and the similar pairs that do not
+        share a blocking key are counted as missed.
+
+        Parameters
+        ----------
+        sample_size : int, optional
+            The number of entries sampled. Defaults to 100.
+        seed : int, optional
+            The seed of the random sample. Defaults to 0.
+
+        Returns
+        -------
+        report : dict[str, float]
+            The number of sampled entries ("sampled"), similar pairs found by
+            brute force ("similar"), those that are also candidates ("found")
+            and the fraction of them ("recall").
+        """
+        entries = list(self.bib_entries.values())
+        _normalize_entries(entries, simplified=True)
+        block_keys = [entry.similarity_block_keys() for entry in entries]
+        sample = random.Random(seed).sample(
+            range(len(entries)), min(sample_size, len(entries))
+        )
+        similar = found = 0
+        for i in sample:
+            for j, other in enumerate(entries):
+                if i != j and entries[i].is_similar(other):
+                    similar += 1
+                    found += not block_keys[i].isdisjoint(block_keys[j])
+        return {
+            "sampled": len(sample),
+            "similar": similar,
+            "found": found,
+            "recall": found / similar if similar else 1.0,
+        }
+
+    def similar_pairs(
+        self, jobs: int = 1, exhaustive: bool = False, n_similarities: int = 3
+    ) -> list[tuple[int, int]]:
+        """
+        Returns the pairs of similar entries (see BibEntry.is_similar) using a
+        pool of processes.
+
+        The workers normalize the entries (see BibEntry.similarity_profile)
+        and compute their blocking keys, which are indexed in this process.
+        The normalized entries are then shared with the same workers through
+        a temporary file, and the rows of the scan (or the buckets of the
+        index) are split in chunks compared by them.
+
+        Parameters
+        ----------
+        jobs : int, optional
+            The number of processes. Defaults to 1.
+        exhaustive : bool, optional
+            If True, all the pairs are compared instead of the candidates
+            given by similar_candidates. Defaults to False.
+        n_similarities : int, optional
+            Passed to BibEntry.is_similar. Defaults to 3.
+
+        Returns
+        -------
+        pairs : list[tuple[int, int]]
+            The sorted (i, j) tuples, with i < j, of indices of the similar
+            entries in bib_entries.
+        """
+        items = [
+            (entry.id_key, dict(entry.fields)) for entry in self.bib_entries.values()
+        ]
+        n_chunks = jobs * 8
+        size = max(1, -(-len(items) // n_chunks))
+        fd, fname = tempfile.mkstemp(suffix=".marshal")
+        os.close(fd)
+        try:
+            with ProcessPoolExecutor(jobs) as executor:
+                profiles, block_keys = [], []
+                for chunk_profiles, chunk_keys in executor.map(
+                    _similarity_profiles,
+                    (items[i : i + size] for i in range(0, len(items), size)),
+                    itertools.repeat(not exhaustive),
+                ):
+                    profiles.extend(chunk_profiles)
+                    if chunk_keys is not None:
+                        block_keys.extend(chunk_keys)
+
+                if exhaustive:
+                    entry_buckets = None
+                    # Rows get shorter, so they are grouped in ranges with a
+                    # similar number of pairs
+                    n_pairs = len(items) * (len(items) - 1) // 2
+                    chunks, start, count = [], 0, 0
+                    for i in range(len(items)):
+                        count += len(items) - 1 - i
+                        if count >= n_pairs / n_chunks:
+                            chunks.append(range(start, i + 1))
+                            start, count = i + 1, 0
+                    if start < len(items):
+                        chunks.append(range(start, len(items)))
+                else:
+                    buckets, entry_buckets = _block_index(block_keys)
+                    del block_keys
+                    # Buckets are grouped in chunks with a similar number of
+                    # pairs (counting those yielded by other buckets)
+                    n_pairs = sum(len(b) * (len(b) - 1) // 2 for b in buckets)
+                    chunks, chunk, count = [], [], 0
+                    for bucket_id, bucket in enumerate(buckets):
+                        chunk.append((bucket_id, bucket))
+                        count += len(bucket) * (len(bucket) - 1) // 2
+                        if count >= n_pairs / n_chunks:
+                            chunks.append(chunk)
+                            chunk, count = [], 0
+                    if chunk:
+                        chunks.append(chunk)
+
+                with open(fname, "wb") as f:
+                    marshal.dump((profiles, entry_buckets), f)
+                del profiles, entry_buckets
+                pairs = [
+                    pair
+                    for chunk in executor.map(
+                        _similar_in_chunk,
+                        itertools.repeat(fname),
+                        chunks,
+                        itertools.repeat(n_similarities),
+                    )
+                    for pair in chunk
+                ]
+        finally:
+            os.remove(fname)
+        # The pairs of the buckets are not sorted
+        return pairs if exhaustive else sorted(pairs)
+
+    def merge_duplicated_entries(self):
+        """
+        Merge the duplicated entries in the bib file
+
+        Returns
+        -------
+        merged_keys: dict[str, str]
+            The keys of the entries that have been merged and the key of the
+            entry that has been merged into. Useful to adapt the latex file
+            with the replace_cite_entries method.
+        """
+        duplicated_entries = self.find_duplicated_entries()
+        merged_keys = {}
+        for group in duplicated_entries:
+            new_entry = self.bib_entries[group[0]]
+            for key in group[1:]:
+                new_entry = new_entry.merge(self.bib_entries[key])
+            for key in group:
+                merged_keys[key] = new_entry.id_key
+                _ = self.bib_entries.pop(key)
+            self.bib_entries[new_entry.id_key] = new_entry
+        return merged_keys
+
+    def get_key_entry(self, entry: "BibEntry", key: str) -> tuple[str, "BibEntry"]:
+        """
+        Get the key and the entry of the bib items that is equal but not the
+        same as the given.
+
+        The entries are looked up in an index of the values compared in
+        BibEntry.__eq__, which gives the same entry as comparing the given
+        one with all of them in order. Lazy bib files, and bib files whose
+        bib_entries were replaced with another kind of dict, are scanned.
+        """
+        if isinstance(self.bib_entries, _IndexedEntries):
+            key2 = self.bib_entries.find_equal(entry, key)
+            if key2 is None:
+                raise ValueError("Entry not found in bib file")
+            return key2, self.bib_entries[key2]
+        for key2, value in self.bib_entries.items():
+            if entry == value and key != key2:
+                return key2, value
+        raise ValueError("Entry not found in bib file")
+
+    def write(self, fout: str, atomic: bool = False):
+        """
+        Writes the bibliography entries to a file
+
+        The entries are formatted and written one at a time, so the text of
+        the whole file is never built. If atomic is True, the file is written
+        to a temporary file that then replaces fout, so fout is never left
+        half written.
+        """
+        _write_bib(
+            fout,
+            self.non_entry_lines,
+            (str(entry) for entry in self.bib_entries.values()),
+            atomic,
+        )
+
+
+def _format_entry(
+    entry_type: str, id_key: str, fields: Iterable[tuple[str, str]]
+) -> str:
+    """
+    Returns the text of a bib entry as written in the bib files (see
+    BibEntry.__str__).
+    """
+    parts = [f"@{entry_type}{{{id_key}"]
+    # Put doble braces to keep uppercase
+    parts.extend(f",\n\t{key} = {{{value}}}" for key, value in fields)
+    parts.append("\n}")
+    return "".join(parts)
+
+
+def _write_bib(
+    fout: str, non_entry_lines: list[str], entries: Iterable[str], atomic: bool
+):
+    """
+    Writes the non entry lines and the text of the entries, separated by
+    ",\n\n", to fout, as str(BibFile) would. If atomic, the text is written to
+    a temporary file in the same directory that replaces fout, with the
+    permissions of fout (or the default ones if it does not exist).
+    """
+    if not atomic:
+        with open(fout, "w") as f:
+            _write_bib_text(f, non_entry_lines, entries)
+        return
+    try:
+        mode = os.stat(fout).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = None
+    fd, tmp_file = _create_temp_file(os.path.dirname(os.path.abspath(fout)))
+    try:
+        with open(fd, "w") as f:
+            _write_bib_text(f, non_entry_lines, entries)
+        if mode is not None:
+            os.chmod(tmp_file, mode)
+        os.replace(tmp_file, fout)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+
+
+def _create_temp_file(directory: str) -> tuple[int, str]:
+    """
+    Creates a new file in directory and returns its descriptor and name. Unlike
+    tempfile.mkstemp, the file gets the default permissions of a new file
+    (0o666 minus the umask), as the umask is applied by the os on creation.
+    """
+    for _ in range(tempfile.TMP_MAX):
+        name = "tmp{:016x}.tmp".format(random.getrandbits(64))
+        fname = os.path.join(directory, name)
+        try:
+            return os.open(fname, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), fname
+        except FileExistsError:
+            continue
+    raise FileExistsError("No usable temporary file name found in " + directory)
+
+
+def _write_bib_text(f: TextIO, non_entry_lines: list[str], entries: Iterable[str]):
+    f.writelines(non_entry_lines)
+    separator = ""
+    for entry in entries:
+        f.write(separator)
+        f.write(entry)
+        separator = ",\n\n"
+
+
+def _author_initials_replacement(match: re.Match) -> str:
+    return " " + " ".join(i + "." for i in match.group(1)) + match.group(2)
+
+
+def _invalidating(method):
+    """
+    Wraps a dict method of _Fields so that it drops the normalized values.
+    """
+
+    def wrapper(self, *args, **kwargs):
+        if self.normalized is not None:
+            self.normalized = None
+            self.report_modified()
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+
+class _Fields(dict):
+    """
+    The fields of a BibEntry. It is a dict that also keeps the normalized
+    values used to compare the entries, which are dropped whenever it is
+    modified.
+
+    The indexes of the entries (see _IndexedEntries) watch the fields with a
+    dict where the fields add themselves (by id) when they are modified.
+    """
+
+    __slots__ = ("normalized", "_watchers")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.normalized: dict[str, Any] = None
+        self._watchers: list[dict[int, "_Fields"]] = None
+
+    def watch(self, modified: dict[int, "_Fields"]):
+        """
+        Adds the fields to modified whenever they are modified or replaced.
+        """
+        if self._watchers is None:
+            self._watchers = [modified]
+        elif not any(watcher is modified for watcher in self._watchers):
+            self._watchers.append(modified)
+
+    def unwatch(self, modified: dict[int, "_Fields"]):
+        if self._watchers is not None:
+            self._watchers = [
+                watcher for watcher in self._watchers if watcher is not modified
+            ]
+
+    def report_modified(self):
+        """
+        Adds the fields to the dicts that watch them.
+        """
+        if self._watchers:
+            for modified in self._watchers:
+                modified[id(self)] = self
+
+    def __reduce__(self):
+        return _Fields, (dict(self),)
+
+    __setitem__ = _invalidating(dict.__setitem__)
+    __delitem__ = _invalidating(dict.__delitem__)
+    __ior__ = _invalidating(dict.__ior__)
+    clear = _invalidating(dict.clear)
+    pop = _invalidating(dict.pop)
+    popitem = _invalidating(dict.popitem)
+    setdefault = _invalidating(dict.setdefault)
+    update = _invalidating(dict.update)
+
+
+class BibEntry:
+    """
+    Class to represent a bibtex entry.
+
+    Note: two BibEntry objects are equal if they have the same id_key, title,
+    doi or issbn.
+
+    Parameters
+    ----------
+    type : str
+        The type of the entry (article, book, ...)
+    id_key : str
+        The bib key of the entry
+    fields : str
+        The text of the bib file with the information of the entry (authors,
+        year, ...)
+
+    Attributes
+    ----------
+    type : str
+        The type of the entry (article, book, ...)
+    id_key : str
+        The bib key of the entry
+    fields : dict[str, str]
+        A dictionary with the fields of the entry.
+
+    """
+
+    # No instance dict, and the entry types and field names are interned, so
+    # that large files take less memory
+    __slots__ = ("type", "id_key", "_fields", "_fields_text")
+
+    def __init__(self, type: str, id_key: str, fields: str = None):
+        self.type = sys.intern(type)
+        self.id_key = id_key
+        self.fields = _Fields()
+        if fields is not None:
+            self.parse_entry(fields)
+
+    @property
+    def fields(self) -> dict[str, str]:
+        if self._fields_text is not None:
+            # The text is kept until it is parsed, so that an invalid entry
+            # raises every time its fields are read
+            self._parse_fields(*self._fields_text)
+            self._fields_text = None
+        return self._fields
+
+    @fields.setter
+    def fields(self, fields: dict[str, str]):
+        old_fields = getattr(self, "_fields", None)
+        if isinstance(old_fields, _Fields):
+            old_fields.report_modified()
+        self._fields = fields
+        self._fields_text = None
+
+    def __repr__(self):
+        return "{} bibentry of {}".format(self.type, self.id_key)
+
+    def __str__(self):
+        return _format_entry(self.type, self.id_key, self.fields.items())
+
+    def __eq__(self, other):
+        if self.id_key == other.id_key:
+            return True
+        eq_keys = self._field_equality_keys()
+        return not eq_keys.isdisjoint(other._field_equality_keys())
+
+    def _normalized(self, name: str, normalize) -> Any:
+        """
+        Returns the normalized value called name, computing it with
+        normalize(self) only the first time. The values are kept in the
+        fields, so they are recomputed when the fields are modified. Fields
+        that are not _Fields (a dict assigned to fields) do not keep them.
+        """
+        fields = self.fields
+        if not isinstance(fields, _Fields):
+            return normalize(self)
+        if fields.normalized is None:
+            fields.normalized = {}
+        try:
+            return fields.normalized[name]
+        except KeyError:
+            value = fields.normalized[name] = normalize(self)
+            return value
+
+    def _field_equality_keys(self) -> frozenset[tuple[str, str]]:
+        return self._normalized("equality_keys", BibEntry._compute_equality_keys)
+
+    def _compute_equality_keys(
+        self, lower_unicode: Callable[[str], str] = convert_to_lower_unicode
+    ) -> frozenset[tuple[str, str]]:
+        eq_keys = []
+        for field in ("title", "doi", "isbn"):
+            value = self.fields.get(field)
+            if value:
+                value = value.lower()
+                # If field title, convert to unicode and lowercase and remomve spaces
+                if field == "title":
+                    value = lower_unicode(value)
+                eq_keys.append((field, value))
+        return frozenset(eq_keys)
+
+    def equality_keys(self) -> set[tuple[str, str]]:
+        """
+        Returns the normalized values compared in __eq__ as (field, value)
+        pairs. Two entries are equal if they share any of them.
+        """
+        eq_keys = {("id_key", self.id_key)}
+        eq_keys.update(self._field_equality_keys())
+        return eq_keys
+
+    def simplified_fields(self) -> dict[str, str]:
+        """
+        Returns the fields that are not empty as compared in is_similar: the
+        volume, number and year stripped and the others simplified (see
+        simplify_field).
+
+        The values are computed once and kept until the fields are modified.
+        The returned dict must not be modified.
+        """
+        return self._normalized("simplified", BibEntry._compute_simplified_fields)
+
+    def _compute_simplified_fields(
+        self, simplify: Callable[[str], str] = simplify_field
+    ) -> dict[str, str]:
+        simplified = {}
+        for field, value in self.fields.items():
+            if not value.strip():
+                continue
+            if field in ("volume", "number", "year"):
+                simplified[field] = value.strip()
+            else:
+                simplified[field] = simplify(value)
+        return simplified
+
+    def author_surnames(self) -> tuple[str, ...]:
+        """
+        Returns the first word of each author in the simplified author field,
+        which is what is_similar compares for the authors. It is empty if the
+        entry has no authors.
+        """
+        return self._normalized("surnames", BibEntry._compute_author_surnames)
+
+    def _compute_author_surnames(self) -> tuple[str, ...]:
+        authors = self.simplified_fields().get("author")
+        if authors is None:
+            return ()
+        return tuple((aut.split() or [""])[0] for aut in authors.split(" and "))
+
+    def similarity_block_keys(self) -> set[tuple]:
+        """
+        Returns the blocking keys used to find the candidates to be similar.
+
+        Besides the equality keys, the values of the fields in
+        SIMILARITY_BLOCKING_FIELDS that are not empty, as compared in
+        is_similar, are combined in keys: every pair of them with at least
+        one field not in SIMILARITY_WEAK_FIELDS, and every triple of weak
+        fields (a year and a volume alone are shared by too many entries).
+        Entries sharing no key are not compared.
+        """
+        return _similarity_block_keys(self.similarity_profile())
+
+    def similarity_profile(self) -> tuple:
+        """
+        Returns the values compared in is_similar normalized, so that they can
+        be compared without the BibEntry (e.g. in other processes).
+
+        The profile is a tuple with the equality keys, the simplified fields
+        and the author surnames.
+        """
+        return (
+            frozenset(self.equality_keys()),
+            self.simplified_fields(),
+            self.author_surnames(),
+        )
+
+    def parse_entry(self, fields: str, start: int = 0, end: int = None):
+        """
+        Parse the text containing the fields of the entry.
+
+        If start and end are given, only fields[start:end] is parsed. The
+        text is kept and parsed the first time the fields are accessed, so
+        the entries whose fields are never read are not parsed.
+        """
+        if end is None:
+            end = len(fields)
+        # Parse the previous text, if any, so that the fields are added in order
+        self.fields
+        self._fields_text = (fields, start, end)
+
+    def _parse_fields(self, text: str, start: int, end: int):
+        """
+        Adds the fields in text[start:end] to the fields.
+
+        The values are stripped, unwrapped from their braces or quotes and
+        sliced from the text at once. The whitespace is only collapsed in the
+        values that need it.
+        """
+        fields = self._fields
+        for name, value_start, value_end in _scan_fields(text, start, end):
+            entry_key = sys.intern(name.lower())
+            while value_start < value_end and text[value_start].isspace():
+                value_start += 1
+            while value_end > value_start and text[value_end - 1].isspace():
+                value_end -= 1
+            if value_end - value_start >= 2 and text[value_start] + text[
+                value_end - 1
+            ] in ("{}", '""'):
+                value_start += 1
+                value_end -= 1
+            field = text[value_start:value_end]
+            if "\n" in field or "\r" in field or "  " in field:
+                field = _FIELD_WHITESPACE_RE.sub(" ", field)
+            if entry_key == "author":
+                # Separate Compound names and add dots JM -> J. M.
+                field = _AUTHOR_INITIALS_RE.sub(_author_initials_replacement, field)
+            fields[entry_key] = field
+
+    def merge(self, other: "BibEntry") -> "BibEntry":
+        """
+        Merge two bib entries. If the entries are the same, the self one is
+        retained.
+        """
+        id_key = self.id_key if len(self.id_key) < len(other.id_key) else other.id_key
+        new_entry = BibEntry(self.type, id_key)
+        new_entry.fields = _Fields({**other.fields, **self.fields})
+        return new_entry
+
+    def is_similar(self, other: "BibEntry", n_similarities: int=3) -> bool:
+        """
+        Check if other bib entry is similar.
+
+        First, checks if they are equal. If not, it checks if the auhors are
+        the same and other fields that are in both entries. If the number of
+        similar fields is greater than n_similarities, the entries are
+        considered similar.
+        """
+        if self == other:
+            return True
+        return _fields_similar(
+            self.simplified_fields(),
+            other.simplified_fields(),
+            self.author_surnames(),
+            other.author_surnames(),
+            n_similarities,
+        )
+
+
+class BibCorpus:
+    """
+    Column-wise store of the entries of many bib files, for bulk operations.
+
+    The entry types, keys and field values are kept in a single string (the
+    arena). Each field is a column with the start and end offsets of its
+    value in the arena for every entry (-1 if the entry does not have the
+    field), so filtering, grouping or normalizing a field scans one column
+    instead of every BibEntry. BibEntry and BibFile objects are built from
+    the columns on demand (see entry and bib_file). They are copies, so
+    modifying them does not modify the corpus.
+
+    Parameters
+    ----------
+    bib_files : Iterable[BibFile | str], optional
+        The bib files (or their names) whose entries are added to the corpus.
+
+    Attributes
+    ----------
+    fnames : list[str]
+        The names of the bib files added to the corpus.
+    file_ids : array.array
+        The index in fnames of the file of each entry.
+    non_entry_lines : list[str]
+        The lines that are not bib entries of all the files.
+
+    """
+
+    def __init__(self, bib_files: Iterable[Union[BibFile, str]] = ()):
+        self.fnames: list[str] = []
+        self.file_ids = array.array("l")
+        self.non_entry_lines: list[str] = []
+        self._arena = ""
+        self._pending: list[str] = []
+        self._size = 0
+        self._types: list[str] = []
+        self._key_offsets = array.array("q")
+        # The keys of the entries in their bib files that are not their
+        # id_key (the entries renamed merging bib files), by index
+        self._renamed_keys: dict[int, str] = {}
+        self._columns: dict[str, tuple[array.array, array.array]] = {}
+        # The field names of each entry, in order, shared by the entries with
+        # the same fields
+        self._schemas: list[tuple[str, ...]] = []
+        self._schema_index: dict[tuple[str, ...], int] = {}
+        self._schema_ids = array.array("l")
+        for bib_file in bib_files:
+            self.add(bib_file)
+
+    def __len__(self) -> int:
+        return len(self._types)
+
+    def __repr__(self):
+        return "Bib corpus of {} entries from {} files".format(
+            len(self), len(self.fnames)
+        )
+
+    @property
+    def arena(self) -> str:
+        """
+        The string with all the keys and field values of the corpus.
+        """
+        if self._pending:
+            self._arena = "".join([self._arena, *self._pending])
+            self._pending = []
+        return self._arena
+
+    @property
+    def fields(self) -> list[str]:
+        """
+        The names of the fields of any entry of the corpus.
+        """
+        return list(self._columns)
+
+    def _store(self, text: str) -> int:
+        start = self._size
+        self._pending.append(text)
+        self._size += len(text)
+        return start
+
+    def add(self, bib_file: Union[BibFile, str]):
+        """
+        Adds the entries of a bib file (or of the bib file with that name).
+        """
+        if isinstance(bib_file, str):
+            bib_file = BibFile(bib_file)
+        items = list(bib_file.bib_entries.items())
+        first, n = len(self), len(items)
+        self.fnames.append(bib_file.fname)
+        self.non_entry_lines.extend(bib_file.non_entry_lines)
+        self.file_ids.extend(array.array("l", [len(self.fnames) - 1]) * n)
+        missing = array.array("q", [-1]) * n
+        for starts, ends in self._columns.values():
+            starts.extend(missing)
+            ends.extend(missing)
+        for i, (key, entry) in enumerate(items, first):
+            if key != entry.id_key:
+                self._renamed_keys[i] = key
+            self._types.append(entry.type)
+            self._key_offsets.append(self._store(entry.id_key))
+            self._key_offsets.append(self._size)
+            schema = tuple(entry.fields)
+            schema_id = self._schema_index.get(schema)
+            if schema_id is None:
+                schema_id = self._schema_index[schema] = len(self._schemas)
+                self._schemas.append(schema)
+            self._schema_ids.append(schema_id)
+            for name, value in entry.fields.items():
+                column = self._columns.get(name)
+                if column is None:
+                    column = self._columns[name] = (
+                        array.array("q", [-1]) * (first + n),
+                        array.array("q", [-1]) * (first + n),
+                    )
+                column[0][i] = self._store(value)
+                column[1][i] = self._size
+
+    def _id_key(self, i: int) -> str:
+        return self.arena[self._key_offsets[2 * i] : self._key_offsets[2 * i + 1]]
+
+    def key(self, i: int) -> str:
+        """
+        Returns the key of the i-th entry in the bib_entries of its bib file,
+        which is its id_key unless it was renamed merging bib files.
+        """
+        if i in self._renamed_keys:
+            return self._renamed_keys[i]
+        return self._id_key(i)
+
+    def keys(self, indices: Iterable[int] = None) -> list[str]:
+        """
+        Returns the keys of the entries (all of them or those in indices), as
+        key does.
+        """
+        arena, offsets = self.arena, self._key_offsets
+        renamed = self._renamed_keys
+        if indices is None:
+            indices = range(len(self))
+        return [
+            renamed[i] if i in renamed else arena[offsets[2 * i] : offsets[2 * i + 1]]
+            for i in indices
+        ]
+
+    def column(self, field: str, indices: Iterable[int] = None) -> list[str]:
+        """
+        Returns the values of a field for the entries (all of them or those in
+        indices). The value is None for the entries without the field.
+        """
+        if indices is None:
+            indices = range(len(self))
+        if field not in self._columns:
+            return [None for _ in indices]
+        arena = self.arena
+        starts, ends = self._columns[field]
+        return [
+            arena[starts[i] : ends[i]] if starts[i] >= 0 else None for i in indices
+        ]
+
+    def normalize(
+        self,
+        field: str,
+        function: Callable[[list[str]], list[str]] = convert_to_lower_unicode_batch,
+        indices: Iterable[int] = None,
+    ) -> list[str]:
+        """
+        Returns the values of a field normalized (e.g. all the titles in
+        lowercase unicode). function takes the list of values of the entries
+        with the field and returns the normalized values in the same order,
+        like convert_to_lower_unicode_batch and simplify_field_batch. The
+        result is None for the entries without the field.
+        """
+        values = self.column(field, indices)
+        normalized = iter(function([value for value in values if value is not None]))
+        return [None if value is None else next(normalized) for value in values]
+
+    def filter(self, field: str, predicate: Callable[[str], bool]) -> list[int]:
+        """
+        Returns the indices of the entries with the field whose value
+        satisfies predicate. The predicate is called once for each distinct
+        value.
+        """
+        selected = {}
+        indices = []
+        for i, value in enumerate(self.column(field)):
+            if value is None:
+                continue
+            keep = selected.get(value)
+            if keep is None:
+                keep = selected[value] = bool(predicate(value))
+            if keep:
+                indices.append(i)
+        return indices
+
+    def filter_years(self, first: int = None, last: int = None) -> list[int]:
+        """
+        Returns the indices of the entries whose year is between first and
+        last (both included, and both optional). Entries without a numeric
+        year are left out.
+        """
+
+        def in_range(year: str) -> bool:
+            year = year.strip()
+            if not year.isdigit():
+                return False
+            return (first is None or int(year) >= first) and (
+                last is None or int(year) <= last
+            )
+
+        return self.filter("year", in_range)
+
+    def group_by(
+        self, field: str, function: Callable[[list[str]], list[str]] = None
+    ) -> dict[str, list[int]]:
+        """
+        Returns the indices of the entries grouped by the value of a field
+        (e.g. the journal), optionally normalized with function (see
+        normalize). The entries without the field are left out.
+        """
+        if function is None:
+            values = self.column(field)
+        else:
+            values = self.normalize(field, function)
+        groups: dict[str, list[int]] = {}
+        for i, value in enumerate(values):
+            if value is not None:
+                groups.setdefault(value, []).append(i)
+        return groups
+
+    def entry(self, i: int) -> BibEntry:
+        """
+        Returns a new BibEntry with a copy of the i-th entry of the corpus.
+        Modifying it does not modify the corpus.
+        """
+        arena = self.arena
+        entry = BibEntry(self._types[i], self._id_key(i))
+        fields = entry.fields
+        for name in self._schemas[self._schema_ids[i]]:
+            starts, ends = self._columns[name]
+            fields[name] = arena[starts[i] : ends[i]]
+        return entry
+
+    def bib_file(self, indices: Iterable[int] = None) -> BibFile:
+        """
+        Returns a BibFile with a copy of the entries (all of them or those in
+        indices). Modifying it does not modify the corpus.
+
+        The entries of each bib file are merged as adding the bib files does
+        (see default_conflict_policy), and the duplicate keys found are listed
+        in merge_conflicts instead of printing warnings. The entries are built
+        the first time they are accessed, except those with duplicate keys.
+        """
+        if indices is None:
+            indices = range(len(self))
+        file_indices: dict[int, list[int]] = {}
+        for i in indices:
+            file_indices.setdefault(self.file_ids[i], []).append(i)
+        bib_file = BibFile()
+        bib_file.non_entry_lines = self.non_entry_lines.copy()
+        bib_file.bib_entries = _LazyBibEntries(self.entry)
+        copy_indices = {}
+        for file_id, indices in file_indices.items():
+            other = BibFile()
+            other.fname = self.fnames[file_id]
+            other.bib_entries = _LazyBibEntries(
+                self.entry, dict(zip(self.keys(indices), indices))
+            )
+            bib_file.merge_conflicts.extend(
+                bib_file._merge_entries(other, default_conflict_policy, copy_indices)
+            )
+        return bib_file
+
+    def export(self, fout: str, indices: Iterable[int] = None, atomic: bool = False):
+        """
+        Writes the entries (all of them or those in indices) to a bib file,
+        as BibFile.write does, without building the BibEntry objects. The
+        non entry lines of all the files are written first.
+        """
+        if indices is None:
+            indices = range(len(self))
+        arena, offsets = self.arena, self._key_offsets
+        schema_columns = [
+            [(name, *self._columns[name]) for name in schema]
+            for schema in self._schemas
+        ]
+        texts = (
+            _format_entry(
+                self._types[i],
+                arena[offsets[2 * i] : offsets[2 * i + 1]],
+                (
+                    (name, arena[starts[i] : ends[i]])
+                    for name, starts, ends in schema_columns[self._schema_ids[i]]
+                ),
+            )
+            for i in indices
+        )
+        _write_bib(fout, self.non_entry_lines, texts, atomic)
+
+
+class StageStats(NamedTuple):
+    """
+    Throughput counters of a stage of a Pipeline.
 
-@lru_cache(maxsize=1024)
-def convert_to_lower_unicode(text: str) -> str:
-    """Converts text to lower unicode and removes brackets."""
-    unicode = ACCENT_CONVERTER.latex_to_text(text)
-    return re.sub("[\ \{\}]", "", unicode.lower())
+    bytes counts the characters of the keys and field values of the entries
+    that left the stage (the text of the fields for the entries not parsed
+    yet, and the characters written for the write stage), and seconds the
+    time spent in the stage itself, without the previous ones.
+    """
 
+    name: str
+    entries: int
+    bytes: int
+    seconds: float
 
-def simplify_field(text: str) -> str:
-    text = ACCENT_CONVERTER.latex_to_text(text)
-    # remove brackets and dots and lowercase
-    text = re.sub("[\{\}\.]", "", text.lower())
-    # replace double dash with single dash
-    return text.replace("--", "-")
+    @property
+    def entries_per_second(self) -> float:
+        return self.entries / self.seconds if self.seconds else 0.0
 
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.seconds if self.seconds else 0.0
 
-class BibFile:
+
+def _entry_size(entry: BibEntry) -> int:
     """
-    Class to manage the bibliography entries in a .bib file
+    Returns the characters of the key and the field values of entry, counting
+    the text of the fields not parsed yet instead of parsing them.
+    """
+    size = len(entry.id_key) + sum(map(len, entry._fields.values()))
+    if entry._fields_text is not None:
+        _, start, end = entry._fields_text
+        size += end - start
+    return size
 
-    Parameters
-    ----------
-    fname : str
-        The name of the bib file
 
-    Attributes
-    ----------
-    bib_entries : dict[str, BibEntry]
-        The bibliography entries in the bib file
-    non_entry_lines : list[str]
-        The lines that are not bib entries (usually header lines)
+def _measured_stage(items: Iterable[Any], counters: list, size=_entry_size):
+    """
+    Yields the items of a stage adding to counters (entries, bytes, seconds)
+    the number of items, their size and the time taken to get them, which
+    includes the time of the previous stages.
+    """
+    iterator = iter(items)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            counters[2] += time.perf_counter() - start
+            return
+        counters[2] += time.perf_counter() - start
+        counters[0] += 1
+        counters[1] += size(item)
+        yield item
+
+
+def _filter_stage(
+    entries: Iterable[BibEntry],
+    types: Iterable[str] = None,
+    first_year: int = None,
+    last_year: int = None,
+    key_pattern: str = None,
+) -> Iterator[BibEntry]:
+    if types is not None:
+        types = {entry_type.lower() for entry_type in types}
+    if key_pattern is not None:
+        key_pattern = re.compile(key_pattern)
+    check_year = first_year is not None or last_year is not None
+    for entry in entries:
+        if types is not None and entry.type.lower() not in types:
+            continue
+        if key_pattern is not None and not key_pattern.search(entry.id_key):
+            continue
+        if check_year:
+            year = entry.fields.get("year", "").strip()
+            if not year.isdigit():
+                continue
+            if first_year is not None and int(year) < first_year:
+                continue
+            if last_year is not None and int(year) > last_year:
+                continue
+        yield entry
 
+
+def _batch_stage(
+    entries: Iterable[BibEntry],
+    batch_size: int,
+    process: Callable[[list[BibEntry]], Any],
+) -> Iterator[BibEntry]:
+    """
+    Yields the entries after calling process on each batch of batch_size
+    entries.
     """
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) == batch_size:
+            process(batch)
+            yield from batch
+            batch = []
+    process(batch)
+    yield from batch
+
+
+def _normalize_fields(
+    entries: list[BibEntry],
+    names: Iterable[str],
+    normalize: Callable[[list[str]], list[str]],
+):
+    """
+    Replaces the values of the fields called names of entries with the
+    results of normalize, called once with all of them.
+    """
+    targets = [
+        (entry.fields, name)
+        for entry in entries
+        for name in names
+        if name in entry.fields
+    ]
+    values = normalize([fields[name] for fields, name in targets])
+    for (fields, name), value in zip(targets, values):
+        fields[name] = value
+
+
+def _deduplicate_stage(entries: Iterable[BibEntry]) -> Iterator[BibEntry]:
+    seen: set[tuple[str, str]] = set()
+    for entry in entries:
+        eq_keys = entry.equality_keys()
+        if seen.isdisjoint(eq_keys):
+            seen.update(eq_keys)
+            yield entry
+
+
+class Pipeline:
+    """
+    Chain of stages (generators) over bib entries, so that large bib files
+    are processed one entry at a time. For example, to keep the articles
+    after 2015:
 
-    def __init__(self, fname: str = None):
-        self.bib_entries: dict[str, BibEntry] = {}
-        self.non_entry_lines: list[str] = []
-        self.fname = fname
-        if self.fname is not None:
-            self.parse_bib()
+        pipeline = Pipeline.from_file("library.bib")
+        pipeline.filter(types=["article"], first_year=2016).write("new.bib")
+        for stats in pipeline.stats():
+            print(stats.name, stats.entries_per_second, stats.bytes_per_second)
 
-    def __getitem__(self, key: str) -> "BibEntry":
-        return self.bib_entries[key]
+    or to write the titles and authors normalized, without duplicates:
 
-    def __repr__(self):
-        return "Bib file: {}".format(self.fname)
+        pipeline = Pipeline.from_file("library.bib")
+        pipeline.normalize().compute_equality_keys().deduplicate()
+        pipeline.write("new.bib")
 
-    def __str__(self):
-        final_str = "".join(self.non_entry_lines)
-        return final_str + ",\n\n".join(
-            str(entry) for entry in self.bib_entries.values()
-        )
+    Each method adds a stage and returns the pipeline. Nothing is read until
+    the pipeline is iterated or written.
 
-    def __add__(self, other: "BibFile") -> "BibFile":
-        new_bib = BibFile()
-        new_bib.non_entry_lines = self.non_entry_lines + other.non_entry_lines
-        new_bib.bib_entries = self.bib_entries.copy()
-        for key, value in other.bib_entries.items():
-            if key in new_bib.bib_entries:
-                text = "Warning: duplicate key {} adding {} and {}.".format(
-                    key, repr(new_bib), repr(other)
-                )
-                if value == new_bib.bib_entries[key]:
-                    print(text + "The entries seem to be the same. Merging")
-                    new_entry = value.merge(new_bib.bib_entries[key])
-                    new_bib.bib_entries[new_entry.id_key] = new_entry
-                else:
-                    new_key = key + "Copy"
-                    index = 1
-                    while new_key + str(index) in new_bib.bib_entries:
-                        index += 1
-                    new_key += str(index)
-                    print(
-                        text
-                        + "The entries seem to be different. Adding both with keys {} and {}. CHECK THIS ENTRY".format(
-                            key, new_key
-                        )
-                    )
-                    new_bib.bib_entries[new_key] = value
-            else:
-                new_bib.bib_entries[key] = value
-        return new_bib
+    Parameters
+    ----------
+    entries : Iterable[BibEntry]
+        The entries that enter the pipeline.
+    name : str, optional
+        The name of the first stage in the stats. Defaults to "source".
+    """
 
-    def __radd__(self, other: Any) -> "BibFile":
-        if not other:
-            return self
-        else:
-            raise ValueError("Cannot add bib files to {}".format(repr(other)))
+    def __init__(self, entries: Iterable[BibEntry], name: str = "source"):
+        self._names: list[str] = []
+        self._counters: list[list] = []
+        self._entries: Iterable[BibEntry] = ()
+        self._add_stage(name, entries)
 
-    def parse_bib(self):
+    @classmethod
+    def from_file(cls, fname: str, chunk_size: int = 1 << 16) -> "Pipeline":
         """
-        Extract the bibliography entries from a bibtex file
+        Returns a pipeline over the entries of a bib file (see iter_entries).
         """
-        with open(self.fname, "r") as f:
-            content = f.read()
-
-        for entry in re.split(r"\@(?=\w+\s*\{)", content):
-            if not entry.strip():
-                continue
-            self.parse_entry(entry)
-
-    def parse_entry(self, entry: str):
+        return cls(iter_entries(fname, chunk_size), "parse")
+
+    def _add_stage(self, name: str, items: Iterable[Any], size=_entry_size):
+        counters = [0, 0, 0.0]
+        self._names.append(name)
+        self._counters.append(counters)
+        self._entries = _measured_stage(items, counters, size)
+
+    def __iter__(self) -> Iterator[BibEntry]:
+        return iter(self._entries)
+
+    def filter(
+        self,
+        types: Iterable[str] = None,
+        first_year: int = None,
+        last_year: int = None,
+        key_pattern: str = None,
+    ) -> "Pipeline":
         """
-        Initialize a bib entry from its corresponding string in the bib file.
+        Keeps the entries of the given types (case insensitive), whose year is
+        between first_year and last_year (both included) and whose key
+        matches the regular expression key_pattern. The conditions that are
+        None are not checked. If a year is given, the entries without a
+        numeric year are dropped.
         """
-        match = re.match(r"(\w+)\s*\{([\S\s]+)\}", entry)
-        if match is None:
-            raise ValueError("Invalid bibtex entry: {}".format(entry))
-
-        entry_type, content = match.groups()
-        if entry_type.lower() in ("control",):
-            self.non_entry_lines.append("@" + entry)
-            return
-        key, fields = content.split("\n", 1)
-        key = key.strip().replace(",", "")
-        self.bib_entries[key] = BibEntry(entry_type, key, fields)
+        self._add_stage(
+            "filter",
+            _filter_stage(self._entries, types, first_year, last_year, key_pattern),
+        )
+        return self
 
-    def find_duplicated_entries(self) -> list[list[str]]:
+    def map(self, function: Callable[[BibEntry], BibEntry]) -> "Pipeline":
         """
-        Find duplicated entries in the bib file checking the title, doi and issbn.
+        Replaces each entry with function(entry).
         """
-        duplicated = []
-        keys, values = list(self.bib_entries.keys()), list(self.bib_entries.values())
-        remaining = deque(list(range(len(keys))))
-        while remaining:
-            index = remaining.popleft()
-            aux = [index]
-            for i in list(remaining):
-                if values[index] == values[i]:
-                    aux.append(i)
-                    remaining.remove(i)
-            if len(aux) > 1:
-                duplicated.append(aux)
-        return [[keys[i] for i in aux] for aux in duplicated]
+        self._add_stage("map", map(function, self._entries))
+        return self
 
-    def merge_duplicated_entries(self):
+    def compute_equality_keys(self, batch_size: int = 1000) -> "Pipeline":
         """
-        Merge the duplicated entries in the bib file
-
-        Returns
-        -------
-        merged_keys: dict[str, str]
-            The keys of the entries that have been merged and the key of the
-            entry that has been merged into. Useful to adapt the latex file
-            with the replace_cite_entries method.
+        Computes and caches the values compared in BibEntry.__eq__ in batches
+        of batch_size entries (see convert_to_lower_unicode_batch), so that
+        deduplicate does not normalize them one entry at a time. The entries
+        are not modified.
         """
-        duplicated_entries = self.find_duplicated_entries()
-        merged_keys = {}
-        for group in duplicated_entries:
-            new_entry = self.bib_entries[group[0]]
-            for key in group[1:]:
-                new_entry = new_entry.merge(self.bib_entries[key])
-            for key in group:
-                merged_keys[key] = new_entry.id_key
-                _ = self.bib_entries.pop(key)
-            self.bib_entries[new_entry.id_key] = new_entry
-        return merged_keys
+        self._add_stage(
+            "equality_keys",
+            _batch_stage(self._entries, batch_size, _normalize_entries),
+        )
+        return self
+
+    def normalize(
+        self,
+        names: Iterable[str] = ("title", "author"),
+        normalize: Callable[[list[str]], list[str]] = simplify_field_batch,
+        batch_size: int = 1000,
+    ) -> "Pipeline":
+        """
+        Replaces the values of the fields called names with their normalized
+        version, e.g. the titles and authors converted to lowercase unicode
+        without braces and dots by default. normalize is called with the
+        values of batch_size entries at once and returns them normalized in
+        the same order (see simplify_field_batch and
+        convert_to_lower_unicode_batch). The entries are modified in place.
+        """
+        names = tuple(names)
+        self._add_stage(
+            "normalize",
+            _batch_stage(
+                self._entries,
+                batch_size,
+                lambda batch: _normalize_fields(batch, names, normalize),
+            ),
+        )
+        return self
 
-    def get_key_entry(self, entry: "BibEntry", key: str) -> tuple[str, "BibEntry"]:
+    def deduplicate(self) -> "Pipeline":
         """
-        Get the key and the entry of the bib items that is equal but not the
-        same as the given.
+        Drops the entries equal (see BibEntry.__eq__) to an entry already
+        passed. Only the normalized values of the passed entries are kept.
         """
-        for key2, value in self.bib_entries.items():
-            if entry == value and key != key2:
-                return key2, value
-        raise ValueError("Entry not found in bib file")
+        self._add_stage("deduplicate", _deduplicate_stage(self._entries))
+        return self
 
-    def write(self, fout: str):
+    def write(self, fout: str, atomic: bool = False) -> int:
         """
-        Writes the bibliography entries to a file
+        Writes the entries to a bib file as BibFile.write does and returns
+        the number of entries written.
         """
-        with open(fout, "w") as f:
-            f.write(str(self))
+        self._add_stage("write", (str(entry) for entry in self._entries), len)
+        counters = self._counters[-1]
+        start = time.perf_counter()
+        _write_bib(fout, [], self._entries, atomic)
+        # Include the time spent writing the text, not only formatting it
+        counters[2] = time.perf_counter() - start
+        return counters[0]
+
+    def stats(self) -> list[StageStats]:
+        """
+        Returns the counters of the stages, in order.
+        """
+        stats = []
+        previous_seconds = 0.0
+        for name, (entries, size, seconds) in zip(self._names, self._counters):
+            stats.append(StageStats(name, entries, size, seconds - previous_seconds))
+            previous_seconds = seconds
+        return stats
+
+
+# Patterns of LatexFile
+_TITLE_RE = re.compile(r"\\title\s*\{([\S\s]*?)\}")
+_USEPACKAGE_RE = re.compile(r"\\usepackage\s*\[[\S\s]*?\]\s*\{([\S\s]*?)\}")
+_WITH_FILE_COMMANDS = (
+    "includegraphics",
+    "input",
+    "include",
+)
+_PARTIAL_PATH_RE = re.compile(
+    r"\\({})".format("|".join(i + ".*?" for i in _WITH_FILE_COMMANDS))
+    + r'\{["\']*(.*?)["\']*\}'
+)
+_LABEL_REF_RE = re.compile(r"\\(label.*?|ref.*?|Cref.*?)\{(.*?)\}")
+_INCLUDE_RE = re.compile(
+    r'\\(?P<command>input|include|subfile)\{["\']*(?P<fname>.*?)["\']*\}'
+)
+_SECTION_RE = re.compile(r"\\section\*?\{([\s\S]*?)\}")
+_UNNUMBERED_SECTION_RE = re.compile(r"(acknowledg|conflicts? of interest?).*")
+_CITE_BEFORE_PUNCTUATION_RE = re.compile(
+    r"(?<![\.\,])\ *([\ \n])(\\cite\{[^\}]*?\})([\.\,])(\s*)"
+)
+_CITE_AFTER_REF_RE = re.compile(r"([Rr]efs?\.)([\ \n])\\cite\{([^\}]*?)\}")
+# Citation command, with its optional arguments, and the cited keys
+_CITE_KEYS_RE = re.compile(r"(\\(?:cite|citenum|citeauthor)(?:\[[^\]]*\])*\{)([^}]*)\}")
+_CITE_KEY_RE = re.compile(r"[^,\s]+")
+# Patterns of the steps of LatexFile.transform, in the order they are applied
+_REWRITE_PATTERNS = {
+    "partial_path": _PARTIAL_PATH_RE,
+    "label_ref": _LABEL_REF_RE,
+    "cite_before_punctuation": _CITE_BEFORE_PUNCTUATION_RE,
+    "cite_after_ref": _CITE_AFTER_REF_RE,
+    "cite_keys": _CITE_KEYS_RE,
+}
+# The same patterns split in the class of their first character and the rest,
+# which checks that character with a lookbehind. Joined, they start with a
+# single character class, so the regex engine can skip the other characters.
+# They must match the same text as _REWRITE_PATTERNS (see _rematching).
+_REWRITE_SCAN_PATTERNS = {
+    "partial_path": (
+        r"\\",
+        r'(?<=\\)(?:includegraphics.*?|input.*?|include.*?)\{["\']*.*?["\']*\}',
+    ),
+    "label_ref": (r"\\", r"(?<=\\)(?:label.*?|ref.*?|Cref.*?)\{.*?\}"),
+    "cite_before_punctuation": (
+        r"\ \n",
+        r"(?<![\.\,][\ \n])(?:(?<=\ )(?:\ *[\ \n])?|(?<=\n))"
+        r"\\cite\{[^\}]*?\}[\.\,]\s*",
+    ),
+    "cite_after_ref": (r"Rr", r"(?<=[Rr])efs?\.[\ \n]\\cite\{[^\}]*?\}"),
+    "cite_keys": (
+        r"\\",
+        r"(?<=\\)(?:cite|citenum|citeauthor)(?:\[[^\]]*\])*\{[^}]*\}",
+    ),
+}
+
+
+@lru_cache(maxsize=None)
+def _rewrites_pattern(names: tuple[str, ...]) -> re.Pattern:
+    """
+    Returns a pattern matching what any of the patterns of _REWRITE_PATTERNS
+    in names would match at each position, in that order of preference.
 
+    The name of the matched pattern is the last group of the match (an empty
+    group at the end of each alternative).
+    """
+    first_chars = "".join(dict.fromkeys(_REWRITE_SCAN_PATTERNS[n][0] for n in names))
+    alternatives = "|".join(
+        f"{_REWRITE_SCAN_PATTERNS[name][1]}(?P<{name}>)" for name in names
+    )
+    return re.compile(f"[{first_chars}](?:{alternatives})")
 
-class BibEntry:
+
+def _rematching(name: str, replace: Callable[[re.Match], str]):
     """
-    Class to represent a bibtex entry.
+    Returns a replacement function for a match of a _rewrites_pattern, which
+    calls replace with the match of _REWRITE_PATTERNS[name] at the same place.
 
-    Note: two BibEntry objects are equal if they have the same id_key, title,
-    doi or issbn.
+    Raises RuntimeError if that pattern does not match the same text, which
+    means that _REWRITE_SCAN_PATTERNS[name] is out of sync with it.
+    """
+    pattern = _REWRITE_PATTERNS[name]
+
+    def replacement(match: re.Match) -> str:
+        rematch = pattern.match(match.string, match.start(), match.end())
+        if rematch is None or rematch.end() != match.end():
+            raise RuntimeError(
+                "The scan pattern of {} does not match as {!r} in {!r}".format(
+                    name, pattern.pattern, match.group(0)
+                )
+            )
+        return replace(rematch)
 
-    Parameters
-    ----------
-    type : str
-        The type of the entry (article, book, ...)
-    id_key : str
-        The bib key of the entry
-    fields : str
-        The text of the bib file with the information of the entry (authors,
-        year, ...)
+    return replacement
+
+
+def _cite_before_punctuation_replacement(match: re.Match) -> str:
+    return match.group(3) + match.group(2) + match.group(1) + match.group(4)
 
-    Attributes
-    ----------
-    type : str
-        The type of the entry (article, book, ...)
-    id_key : str
-        The bib key of the entry
-    fields : dict[str, str]
-        A dictionary with the fields of the entry.
 
+def _cite_after_ref_replacement(match: re.Match) -> str:
+    return match.group(1) + match.group(2) + r"\citenum{" + match.group(3) + "}"
+
+
+def _cite_keys_replacement(merged_dict: dict[str, str]) -> Callable[[re.Match], str]:
+    """
+    Returns the replacement function of _CITE_KEYS_RE that replaces the cited
+    keys in merged_dict with their values.
     """
 
-    def __init__(self, type: str, id_key: str, fields: str = None):
-        self.type = type
-        self.id_key = id_key
-        self.fields: dict[str, str] = {}
-        if fields is not None:
-            self.parse_entry(fields)
+    def replace_key(match: re.Match) -> str:
+        return merged_dict.get(match.group(0), match.group(0))
 
-    def __repr__(self):
-        return "{} bibentry of {}".format(self.type, self.id_key)
+    def replace_keys(match: re.Match) -> str:
+        keys = _CITE_KEY_RE.sub(replace_key, match.group(2))
+        return match.group(1) + keys + "}"
 
-    def __str__(self):
-        final_str = f"@{self.type}{{{self.id_key},\n"
-        for key, value in self.fields.items():
-            # Put doble braces to keep uppercase
-            final_str += f"\t{key} = {{{value}}},\n"
-        final_str = final_str[:-2] + "\n}"
-        return final_str
+    return replace_keys
 
-    def __eq__(self, other):
-        cond = self.id_key == other.id_key
-        for field in ("title", "doi", "isbn"):
-            if field in self.fields and field in other.fields:
-                if self.fields[field] and other.fields[field]:
-                    field_1 = self.fields[field].lower()
-                    field_2 = other.fields[field].lower()
-                    # If field title, convert to unicode and lowercase and remomve spaces
-                    if field == "title":
-                        field_1 = convert_to_lower_unicode(field_1)
-                        field_2 = convert_to_lower_unicode(field_2)
 
-                    cond = cond or (field_1 == field_2)
-        return cond
+class IncludedFile(NamedTuple):
+    """
+    A file included in a latex file (see LatexFile.substitute_inputs).
 
-    def parse_entry(self, fields: str):
-        """
-        Parse the text containing the fields of the entry.
-        """
-        key_split = re.split("\s*(\w+)\s*=\s*", fields)
-        entry_key = None
-        for element in key_split:
-            if not element.strip():
-                continue
-            if entry_key is None:
-                entry_key = element.lower()
-            else:
-                field = element.strip()
-                if field[-1] == ",":
-                    field = field[:-1]
-                field = re.sub("[\n\r\ ]+", " ", field)
-                if re.fullmatch("\{.*\}", field) or re.fullmatch('".*"', field):
-                    field = field[1:-1]
-                if entry_key == "author":
-                    # Separate Compound names and add dots JM -> J. M.
-                    field = re.sub(
-                        r"\s+([A-Z]+)(\s|$)",
-                        lambda m: " "
-                        + " ".join(i + "." for i in m.group(1))
-                        + m.group(2),
-                        field,
-                    )
-                self.fields[entry_key] = field
-                entry_key = None
+    depth is 1 for the files included by the latex file itself, 2 for the
+    files included by those, and so on. command is "input", "include" or
+    "subfile".
+    """
 
-    def merge(self, other: "BibEntry") -> "BibEntry":
-        """
-        Merge two bib entries. If the entries are the same, the self one is
-        retained.
-        """
-        id_key = self.id_key if len(self.id_key) < len(other.id_key) else other.id_key
-        new_entry = BibEntry(self.type, id_key)
-        new_entry.fields = {**other.fields, **self.fields}
-        return new_entry
+    depth: int
+    command: str
+    fname: str
 
-    def is_similar(self, other: "BibEntry", n_similarities: int=3) -> bool:
-        """
-        Check if other bib entry is similar.
 
-        First, checks if they are equal. If not, it checks if the auhors are
-        the same and other fields that are in both entries. If the number of
-        similar fields is greater than n_similarities, the entries are
-        considered similar.
-        """
-        if self == other:
-            return True
-        common_not_empty_fields = []
-        for field in set(self.fields.keys()) & set(other.fields.keys()):
-            if self.fields[field].strip() and other.fields[field].strip():
-                common_not_empty_fields.append(field)
-        similarities = 0
-        for field in common_not_empty_fields:
-            # Special quick checks that restrict the number of comparisons
-            if field in ("volume", "number", "year"):
-                if self.fields[field].strip() == other.fields[field].strip():
-                    similarities += 1
-                    continue
-                return False
-            # Authors are tricky H. William can be the same as Humayun William
-            # We only check the last name
-            field1 = simplify_field(self.fields[field])
-            field2 = simplify_field(other.fields[field])
-            if field1 == field2:
-                similarities += 1
-            elif field == "author":
-                authors1 = field1.split(" and ")
-                authors2 = field2.split(" and ")
-                if len(authors1) != len(authors2):
-                    return False
-                similarities += all(
-                    aut1.split()[0] == aut2.split()[0]
-                    for aut1, aut2 in zip(authors1, authors2)
-                )
+def _document_body(content: str) -> str:
+    """
+    Returns the text between \\begin{document} and \\end{document}, or the
+    whole content if it is not a document.
+    """
+    start = content.find(r"\begin{document}")
+    if start == -1:
+        return content
+    start += len(r"\begin{document}")
+    end = content.find(r"\end{document}", start)
+    return content[start:] if end == -1 else content[start:end]
+
+
+@lru_cache(maxsize=4096)
+def _resolve_input_path(f_input: str, file_dir: str, cwd: str) -> tuple[str, str]:
+    """
+    Returns the path of a file included from a latex file in file_dir, when
+    the working directory is cwd, and its real path.
 
-        return similarities >= n_similarities
+    The path is relative to the working directory or else to file_dir, and
+    .tex is added if the file has no extension. Only the found paths are
+    cached.
+    """
+    if len(os.path.basename(f_input).split(".")) == 1:
+        f_input += ".tex"
+    if not os.path.exists(f_input):
+        f_input = os.path.join(file_dir, f_input)
+        if not os.path.exists(f_input):
+            raise FileNotFoundError(f"File {f_input} not found to replace the input.")
+    return f_input, os.path.realpath(f_input)
+
+
+class _InputCache:
+    """
+    Contents of the files included in latex files, shared by all the
+    LatexFile instances.
+
+    The contents are stored without the \\endinput commands and keyed by
+    absolute path. A content is read again if the modification time or the
+    size of the file change, and the least recently used contents are dropped
+    when they add up to more than max_chars characters.
+    """
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.chars = 0
+        self.reads = 0
+        self._contents = {}
+
+    def read(self, fname: str) -> str:
+        path = os.path.abspath(fname)
+        stat = os.stat(path)
+        cached = self._contents.pop(path, None)
+        if cached is not None:
+            if cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                self._contents[path] = cached
+                return cached[2]
+            self.chars -= len(cached[2])
+
+        with open(path, "r") as f:
+            content = f.read()
+        content = content.replace(r"\endinput", "")
+        self.reads += 1
+        self._contents[path] = (stat.st_mtime_ns, stat.st_size, content)
+        self.chars += len(content)
+        while self.chars > self.max_chars and len(self._contents) > 1:
+            oldest = self._contents.pop(next(iter(self._contents)))
+            self.chars -= len(oldest[2])
+        return content
+
+    def clear(self):
+        self._contents.clear()
+        self.chars = 0
+
+
+_INPUT_CACHE = _InputCache(64 * 1024 * 1024)
+
+
+def clear_input_cache():
+    """
+    Empties the caches of included files and paths shared by the LatexFile
+    instances.
+    """
+    _INPUT_CACHE.clear()
+    _resolve_input_path.cache_clear()
 
 
 class LatexFile:
@@ -359,6 +2981,9 @@ class LatexFile:
         The packages included in the latex file. The keys are the package names
         and the values are the lines used to include the package (with the
         additional options).
+    include_tree : list[IncludedFile]
+        The files included by the last call to substitute_inputs, in the order
+        they appear in the document.
 
     """
 
@@ -371,6 +2996,7 @@ class LatexFile:
         self.modified_content = self.original_content
         self.title = self.get_title()
         self.packages = self.get_packages()
+        self.include_tree = []
 
     def __str__(self) -> str:
         return self.modified_content
@@ -378,21 +3004,76 @@ class LatexFile:
     def __repr__(self) -> str:
         return "LatexFile {}".format(self.fname)
 
-    def _input_to_replace(self, match: re.Match):
-        f_input = match.group(1)
-        if len(os.path.basename(f_input).split(".")) == 1:
-            f_input += ".tex"
-        if not os.path.exists(f_input):
-            f_input = os.path.join(self.file_dir, f_input)
-            if not os.path.exists(f_input):
-                raise FileNotFoundError(
-                    f"File {f_input} not found to replace the input."
+    def _read_input(self, f_input: str) -> str:
+        """
+        Returns the content of an included file without the \\endinput commands.
+
+        The contents are cached for all the LatexFile instances while the files
+        are not modified (see clear_input_cache).
+        """
+        return _INPUT_CACHE.read(f_input)
+
+    def _expand_inputs(
+        self,
+        content: str,
+        parts: list[str],
+        stack: list[str],
+        expanded: dict[tuple[str, bool], tuple[int, int, int, int, int]],
+    ):
+        """
+        Appends content to parts with the included files expanded.
+
+        stack holds the real paths of the files being expanded, starting with
+        the latex file itself, and expanded maps the files already expanded
+        (and whether they were subfiles) to their slices of parts and
+        include_tree and their depth, so that they are copied instead of
+        expanded again.
+        """
+        depth = len(stack)
+        cwd = os.getcwd()
+        position = 0
+        for match in _INCLUDE_RE.finditer(content):
+            parts.append(content[position : match.start()])
+            position = match.end()
+            command = match.group("command")
+            f_input, path = _resolve_input_path(
+                match.group("fname"), self.file_dir, cwd
+            )
+            if path in stack:
+                cycle = stack[stack.index(path) :] + [path]
+                raise ValueError("Include cycle: " + " -> ".join(cycle))
+            self.include_tree.append(IncludedFile(depth, command, f_input))
+            if command == "include":
+                parts.append("\\clearpage\n")
+
+            key = (path, command == "subfile")
+            if key in expanded:
+                part_start, part_end, tree_start, tree_end, old_depth = expanded[key]
+                parts.extend(parts[part_start:part_end])
+                self.include_tree.extend(
+                    included._replace(depth=included.depth - old_depth + depth)
+                    for included in self.include_tree[tree_start:tree_end]
+                )
+            else:
+                included_content = self._read_input(f_input)
+                if command == "subfile":
+                    included_content = _document_body(included_content)
+                part_start = len(parts)
+                tree_start = len(self.include_tree)
+                stack.append(path)
+                self._expand_inputs(included_content, parts, stack, expanded)
+                stack.pop()
+                expanded[key] = (
+                    part_start,
+                    len(parts),
+                    tree_start,
+                    len(self.include_tree),
+                    depth,
                 )
 
-        with open(f_input, "r") as f:
-            content = f.read()
-        content = content.replace(r"\endinput", "")
-        return content
+            if command == "include":
+                parts.append("\n\\clearpage")
+        parts.append(content[position:])
 
     def _label_ref_to_replace(self, match: re.Match):
         label = match.group(2)
@@ -411,7 +3092,7 @@ class LatexFile:
         """
         Returns the title defined in the latex file.
         """
-        match = re.search(r"\\title\s*\{([\S\s]*?)\}", self.modified_content)
+        match = _TITLE_RE.search(self.modified_content)
         if match:
             return match.group(1).strip()
         else:
@@ -422,9 +3103,7 @@ class LatexFile:
         Parses the included packages in the latex file.
         """
         packages = {}
-        for match in re.finditer(
-            r"\\usepackage\s*\[[\S\s]*?\]\s*\{([\S\s]*?)\}", self.modified_content
-        ):
+        for match in _USEPACKAGE_RE.finditer(self.modified_content):
             packages[match.group(1)] = match.group(0)
         return packages
 
@@ -440,12 +3119,20 @@ class LatexFile:
             f.write(str(self))
 
     def replace_cite_entries(self, merged_dict: dict[str, str]):
-        for old, new in merged_dict.items():
-            self.modified_content = re.sub(
-                r"(\\(cite|citenum|citeauthor)\{[\S\s]*?)" + old,
-                lambda m: m.group(1) + new,
-                self.modified_content,
-            )
+        """
+        Replaces the keys cited with \\cite, \\citenum or \\citeauthor that are
+        in merged_dict with their values (e.g. the keys returned by
+        BibFile.merge_duplicated_entries).
+
+        The document is scanned once, and each cited key is looked up in
+        merged_dict, so only whole keys are replaced. The spacing around the
+        keys is kept.
+        """
+        if not merged_dict:
+            return
+        self.modified_content = _CITE_KEYS_RE.sub(
+            _cite_keys_replacement(merged_dict), self.modified_content
+        )
 
     def diff(self):
         """
@@ -461,18 +3148,8 @@ class LatexFile:
         """
         Fix partial paths defined in the latex file.
         """
-        with_file_commands = (
-            "includegraphics",
-            "input",
-            "include",
-        )
-        commands_for_re = r"\\({})".format(
-            "|".join(i + ".*?" for i in with_file_commands)
-        )
-        self.modified_content = re.sub(
-            commands_for_re + r'\{["\']*(.*?)["\']*\}',
-            self._path_to_replace,
-            self.modified_content,
+        self.modified_content = _PARTIAL_PATH_RE.sub(
+            self._path_to_replace, self.modified_content
         )
 
     def fix_labels_refs(self):
@@ -480,22 +3157,39 @@ class LatexFile:
         Changes the labels and references to add the file label and avoid
         duplicates.
         """
-        self.modified_content = re.sub(
-            r"\\(label.*?|ref.*?|Cref.*?)\{(.*?)\}",
-            self._label_ref_to_replace,
-            self.modified_content,
+        self.modified_content = _LABEL_REF_RE.sub(
+            self._label_ref_to_replace, self.modified_content
         )
 
     def substitute_inputs(self):
         """
         Substitutes the inputs in the latex file with their content.
+
+        The \\input, \\include and \\subfile commands are expanded
+        recursively in a single pass: each file is read and expanded once,
+        even if it is included several times. \\include surrounds the content
+        with \\clearpage and \\subfile only keeps the body of the document.
+        The included files are listed in include_tree (see
+        print_include_tree).
+
+        Raises
+        ------
+        ValueError
+            If a file includes itself, directly or through other files.
         """
-        while r"\input{" in self.modified_content:
-            self.modified_content = re.sub(
-                r'\\input\{["\']*(.*?)["\']*\}',
-                self._input_to_replace,
-                self.modified_content,
-            )
+        parts = []
+        self.include_tree = []
+        self._expand_inputs(
+            self.modified_content, parts, [os.path.realpath(self.fname)], {}
+        )
+        self.modified_content = "".join(parts)
+
+    def print_include_tree(self):
+        """
+        Prints the files included by substitute_inputs, indented by depth.
+        """
+        for included in self.include_tree:
+            print("  " * included.depth + f"\\{included.command}{{{included.fname}}}")
 
     def extract_sections(self, unnumbered_sections: bool = True):
         """
@@ -516,9 +3210,8 @@ class LatexFile:
         """
         start = False
         final_lines = []
-        sec_re = re.compile(r"\\section\*?\{([\s\S]*?)\}")
         for line in self.modified_content.splitlines():
-            if not start and (match := sec_re.match(line)):
+            if not start and (match := _SECTION_RE.match(line)):
                 if not match.group(1).strip():
                     continue
                 final_lines.append(r"\section{" + match.group(1) + "}")
@@ -530,12 +3223,9 @@ class LatexFile:
                     break
                 elif r"\bibliography" in line:
                     continue
-                elif match := sec_re.match(line):
+                elif match := _SECTION_RE.match(line):
                     section = match.group(1).strip().lower()
-                    if unnumbered_sections and re.match(
-                        r"(acknowledg|conflicts? of interest?).*",
-                        section,
-                    ):
+                    if unnumbered_sections and _UNNUMBERED_SECTION_RE.match(section):
                         final_lines.append(r"\section*{" + match.group(1) + "}")
                     else:
                         final_lines.append(r"\section{" + match.group(1) + "}")
@@ -550,17 +3240,94 @@ class LatexFile:
 
         Also ensures that the cites made after "Ref." are citenum.
         """
-        self.modified_content = re.sub(
-            r"(?<![\.\,])\ *([\ \n])(\\cite\{[^\}]*?\})([\.\,])(\s*)",
-            lambda m: m.group(3) + m.group(2) + m.group(1) + m.group(4),
-            self.modified_content,
+        self.modified_content = _CITE_BEFORE_PUNCTUATION_RE.sub(
+            _cite_before_punctuation_replacement, self.modified_content
         )
-        self.modified_content = re.sub(
-            r"([Rr]efs?\.)([\ \n])\\cite\{([^\}]*?)\}",
-            lambda m: m.group(1) + m.group(2) + r"\citenum{" + m.group(3) + "}",
-            self.modified_content,
+        self.modified_content = _CITE_AFTER_REF_RE.sub(
+            _cite_after_ref_replacement, self.modified_content
         )
 
+    def transform(
+        self,
+        inputs: bool = True,
+        partial_paths: bool = True,
+        labels_refs: bool = True,
+        citations: bool = True,
+        merged_dict: dict[str, str] = None,
+        sections: bool = True,
+        unnumbered_sections: bool = True,
+    ):
+        """
+        Prepares the latex file to be included in a thesis in a single pass.
+
+        Does what substitute_inputs, fix_partial_paths, fix_labels_refs,
+        adapt_citations, replace_cite_entries and extract_sections do when
+        called in this order, but the patterns of the enabled steps after
+        substitute_inputs are joined in one regular expression, so the
+        expanded document is scanned once for all of them. extract_sections
+        then runs over its lines. Unlike the chained calls, a replacement
+        never matches the text produced by another one.
+
+        Parameters
+        ----------
+        inputs : bool, optional
+            If True, substitutes the included files. Defaults to True.
+        partial_paths : bool, optional
+            If True, fixes the partial paths. Defaults to True.
+        labels_refs : bool, optional
+            If True, adds the file label to the labels and references.
+            Defaults to True.
+        citations : bool, optional
+            If True, adapts the citations (see adapt_citations). Defaults to
+            True.
+        merged_dict : dict[str, str], optional
+            The cited keys to replace (see replace_cite_entries). Defaults to
+            None.
+        sections : bool, optional
+            If True, extracts the sections (see extract_sections). Defaults to
+            True.
+        unnumbered_sections : bool, optional
+            Passed to extract_sections. Defaults to True.
+        """
+        replacements = {}
+        if partial_paths:
+            replacements["partial_path"] = self._path_to_replace
+        if labels_refs:
+            replacements["label_ref"] = self._label_ref_to_replace
+        if citations:
+            replacements["cite_before_punctuation"] = (
+                _cite_before_punctuation_replacement
+            )
+            replacements["cite_after_ref"] = _cite_after_ref_replacement
+        if merged_dict:
+            replace_keys = _cite_keys_replacement(merged_dict)
+            if citations:
+                # The adapted citations also get their keys replaced
+                def with_keys(adapt: Callable[[re.Match], str]):
+                    def replacement(match: re.Match) -> str:
+                        return _CITE_KEYS_RE.sub(replace_keys, adapt(match))
+
+                    return replacement
+
+                for name in ("cite_before_punctuation", "cite_after_ref"):
+                    replacements[name] = with_keys(replacements[name])
+            replacements["cite_keys"] = replace_keys
+
+        if inputs:
+            self.substitute_inputs()
+        names = tuple(name for name in _REWRITE_PATTERNS if name in replacements)
+        if names:
+            replacements = {
+                name: _rematching(name, replace)
+                for name, replace in replacements.items()
+            }
+            self.modified_content = _rewrites_pattern(names).sub(
+                lambda match: replacements[match.lastgroup](match),
+                self.modified_content,
+            )
+        if sections:
+            self.extract_sections(unnumbered_sections)
+
     def lines_for_results(self):
         """
         Returns the lines to add in the results.tex file in the thesis.
@@ -585,23 +3352,70 @@ if __name__ == "__main__":
 
         python3 parsers.py bibliography.bib similar_entries.txt
     """
-    import sys
-
-    bfil = BibFile(sys.argv[1])
-    fout = sys.argv[2] if len(sys.argv) > 2 else 'similar_bib_entries.txt'
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Find possible duplicated entries in a bib file."
+    )
+    parser.add_argument("bib_file", help="The bib file to check.")
+    parser.add_argument(
+        "output",
+        nargs="?",
+        default="similar_bib_entries.txt",
+        help="The file to write the similar entries to.",
+    )
+    parser.add_argument(
+        "--exhaustive",
+        action="store_true",
+        help="Compare all the pairs of entries instead of the candidates.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Compare the entries in N processes.",
+    )
+    parser.add_argument(
+        "--recall",
+        type=int,
+        metavar="N",
+        help="Print the recall of the candidates on a sample of N entries.",
+    )
+    args = parser.parse_args()
+
+    bfil = BibFile(args.bib_file)
+    fout = args.output
 
     entries = list(bfil.bib_entries.values())
 
+    if args.recall:
+        print(bfil.similar_candidates_recall(args.recall))
+
+    if args.jobs > 1:
+        pairs = bfil.similar_pairs(args.jobs, args.exhaustive)
+        similar = tqdm(pairs)
+    else:
+        if args.exhaustive:
+            pairs = itertools.combinations(range(len(entries)), 2)
+            n_pairs = len(entries) * (len(entries) - 1) // 2
+        else:
+            pairs = bfil.iter_similar_candidates()
+            n_pairs = None
+        similar = (
+            (i, j)
+            for i, j in tqdm(pairs, total=n_pairs)
+            if entries[i].is_similar(entries[j])
+        )
+        if not args.exhaustive:
+            similar = sorted(similar)
+
     with open(fout, 'w') as f:
-        progress = tqdm(total=len(entries)*(len(entries)-1)/2)
-        for i, ent in tqdm(enumerate(entries)):
-            first = True
-            for j in range(i+1, len(entries)):
-                progress.update()
-                if ent.is_similar(entries[j]):
-                    if first:
-                        f.write("# This entry:\n")
-                        f.write(str(ent) + '\n')
-                        f.write("# Is similar to:\n\n")
-                        first = False
-                    f.write(str(entries[j]) + '\n\n')
\ No newline at end of file
+        last = None
+        for i, j in similar:
+            if i != last:
+                f.write("# This entry:\n")
+                f.write(str(entries[i]) + '\n')
+                f.write("# Is similar to:\n\n")
+                last = i
+            f.write(str(entries[j]) + '\n\n')
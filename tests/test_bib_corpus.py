@@ -0,0 +1,91 @@
+from parsers import BibCorpus, BibFile
+
+FILE_1 = """@article{same,
+  title = {Shared title},
+  year = {2020}
+}
+
+@article{clash,
+  title = {First title},
+  year = {2021}
+}
+
+@article{only1,
+  title = {Only in the first file}
+}
+"""
+
+FILE_2 = """@article{clash,
+  title = {Another title},
+  year = {2019}
+}
+
+@article{same,
+  title = {Shared title},
+  doi = {10.1/x}
+}
+
+@article{only2,
+  title = {Only in the second file}
+}
+"""
+
+
+def write_files(tmp_path):
+    fnames = []
+    for i, text in enumerate((FILE_1, FILE_2)):
+        fname = tmp_path / "file{}.bib".format(i)
+        fname.write_text(text)
+        fnames.append(str(fname))
+    return fnames
+
+
+def test_bib_file_merges_duplicate_keys_as_add(tmp_path):
+    fnames = write_files(tmp_path)
+    added = BibFile(fnames[0]) + BibFile(fnames[1])
+
+    bib_file = BibCorpus(fnames).bib_file()
+
+    assert list(bib_file.bib_entries) == list(added.bib_entries)
+    for key, entry in added.bib_entries.items():
+        assert bib_file[key].type == entry.type
+        assert dict(bib_file[key].fields) == dict(entry.fields)
+    assert bib_file.merge_conflicts == added.merge_conflicts
+
+
+def test_bib_file_only_builds_accessed_entries(tmp_path):
+    bib_file = BibCorpus(write_files(tmp_path)).bib_file()
+
+    loaded = [
+        key
+        for key, value in bib_file.bib_entries._data.items()
+        if not isinstance(value, int)
+    ]
+    # Entries with the same key are equal (see BibEntry.__eq__), so merged
+    assert loaded == ["same", "clash"]
+
+
+def test_entries_are_copies(tmp_path):
+    corpus = BibCorpus(write_files(tmp_path))
+
+    corpus.entry(0).fields["title"] = "Modified"
+    corpus.bib_file()["only1"].fields["title"] = "Modified"
+
+    assert corpus.column("title")[0] == "Shared title"
+    assert corpus.column("title")[2] == "Only in the first file"
+
+
+def test_bib_file_keeps_renamed_keys(tmp_path):
+    fnames = write_files(tmp_path)
+    renamed = BibFile.merge_all(
+        [BibFile(fname) for fname in fnames], lambda key, entry, other: "rename"
+    )
+    corpus = BibCorpus([renamed])
+
+    assert corpus.keys() == list(renamed.bib_entries)
+    bib_file = corpus.bib_file()
+    assert list(bib_file.bib_entries) == list(renamed.bib_entries)
+    for key, entry in renamed.bib_entries.items():
+        assert bib_file[key].id_key == entry.id_key
+        assert dict(bib_file[key].fields) == dict(entry.fields)
+    assert str(bib_file) == str(renamed)
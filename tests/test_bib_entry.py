@@ -0,0 +1,40 @@
+import pytest
+
+from parsers import BibEntry
+
+
+def parse(fields: str) -> dict[str, str]:
+    entry = BibEntry("article", "key")
+    entry.parse_entry(fields)
+    return dict(entry.fields)
+
+
+@pytest.mark.parametrize(
+    "fields, expected",
+    [
+        ("title = {A}\n  journal = {B}", {"title": "A", "journal": "B"}),
+        ('title = "a = b" journal = {B}', {"title": "a = b", "journal": "B"}),
+        ("year = 2020\n  month = jan", {"year": "2020", "month": "jan"}),
+        ("title = {A {B}} # {C}\n  note = {N}", {"title": "A {B}} # {C", "note": "N"}),
+        ("title = {x = y}, note = {N}", {"title": "x = y", "note": "N"}),
+    ],
+)
+def test_missing_comma_between_fields(fields, expected):
+    assert parse(fields) == expected
+
+
+def test_comment_lines_between_fields():
+    fields = "title = {A},\n% journal = {X},\n  url = {a%20b},\n  %\n  year = 1\n"
+    assert parse(fields) == {"title": "A", "url": "a%20b", "year": "1"}
+
+
+def test_text_that_is_not_a_field_raises():
+    with pytest.raises(ValueError, match="Invalid bibtex field: 'garbage'"):
+        parse("title = {A}, garbage")
+
+
+def test_invalid_fields_raise_every_time():
+    entry = BibEntry("article", "key", "title = {A}, garbage")
+    for _ in range(2):
+        with pytest.raises(ValueError, match="Invalid bibtex field"):
+            entry.fields
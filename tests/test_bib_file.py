@@ -0,0 +1,208 @@
+import pickle
+
+import pytest
+
+from parsers import BibEntry, BibFile, iter_entries
+
+
+def test_parse_entry():
+    bib_file = BibFile()
+    bib_file.parse_entry("article{key1,\n  title = {A title},\n  year = {2020}\n}")
+
+    assert list(bib_file.bib_entries) == ["key1"]
+    assert bib_file["key1"].fields["title"] == "A title"
+
+
+def test_parse_invalid_entry_raises():
+    with pytest.raises(ValueError, match="Invalid bibtex entry"):
+        BibFile().parse_entry("garbage")
+
+
+def test_get_key_entry_sees_fields_modified_in_place():
+    bib_file = BibFile()
+    bib_file.parse_entry("article{k1,\n  title = {Alpha}\n}")
+    bib_file.parse_entry("article{k2,\n  title = {Beta}\n}")
+    alpha = BibFile()
+    alpha.parse_entry("article{other,\n  title = {Alpha}\n}")
+    gamma = BibFile()
+    gamma.parse_entry("article{other,\n  title = {Gamma}\n}")
+    assert bib_file.get_key_entry(alpha["other"], "other")[0] == "k1"
+
+    bib_file["k1"].fields["title"] = "Gamma"
+    with pytest.raises(ValueError, match="Entry not found"):
+        bib_file.get_key_entry(alpha["other"], "other")
+    assert bib_file.get_key_entry(gamma["other"], "other")[0] == "k1"
+
+    bib_file["k2"].fields = {"title": "Alpha"}
+    assert bib_file.get_key_entry(alpha["other"], "other")[0] == "k2"
+
+
+def test_pickle_round_trip():
+    bib_file = BibFile()
+    bib_file.parse_entry("article{k1,\n  title = {Alpha}\n}")
+    bib_file.parse_entry("article{k2,\n  title = {Beta}\n}")
+    bib_file.get_key_entry(bib_file["k1"], "other")
+
+    loaded = pickle.loads(pickle.dumps(bib_file))
+    assert str(loaded) == str(bib_file)
+    assert loaded.get_key_entry(bib_file["k2"], "other")[0] == "k2"
+    loaded["k1"].fields["title"] = "Beta"
+    assert loaded.get_key_entry(bib_file["k2"], "k2")[0] == "k1"
+
+
+def test_assigned_bib_entries_are_kept():
+    bib_file = BibFile()
+    bib_file.parse_entry("article{k1,\n  title = {Alpha}\n}")
+    entries = {"k1": bib_file["k1"]}
+    bib_file.bib_entries = entries
+    entries["k2"] = bib_file["k1"]
+
+    assert bib_file.bib_entries is entries
+    assert bib_file.get_key_entry(bib_file["k1"], "k1")[0] == "k2"
+
+
+def test_assigned_fields_are_kept():
+    bib_file = BibFile()
+    bib_file.parse_entry("article{k1,\n  title = {Alpha}\n}")
+    alpha = BibFile()
+    alpha.parse_entry("article{other,\n  title = {Alpha}\n}")
+    assert bib_file.get_key_entry(alpha["other"], "other")[0] == "k1"
+
+    fields = {"title": "Alpha"}
+    bib_file["k1"].fields = fields
+    fields["year"] = "1"
+    assert bib_file["k1"].fields is fields
+    assert bib_file["k1"].fields["year"] == "1"
+    assert bib_file.get_key_entry(alpha["other"], "other")[0] == "k1"
+    fields["title"] = "Gamma"
+    with pytest.raises(ValueError, match="Entry not found"):
+        bib_file.get_key_entry(alpha["other"], "other")
+
+
+def test_edits_are_reported_to_the_watching_index_only():
+    bib_file = BibFile()
+    bib_file.parse_entry("article{k1,\n  title = {Alpha}\n}")
+    other = BibFile()
+    other.parse_entry("article{k2,\n  title = {Beta}\n}")
+    assert bib_file.bib_entries.find_equal(bib_file["k1"], "k1") is None
+    assert other.bib_entries.find_equal(other["k2"], "k2") is None
+
+    other["k2"].fields["title"] = "Gamma"
+    assert not bib_file.bib_entries._modified
+    assert other.bib_entries._modified
+
+
+SPECIAL_ENTRIES = """@article(k1, title = "Water (ice) phases", year = 2020)
+
+@misc{k2, note = {see @book{x} and a@b.com}, title = {T}}
+
+@book(k3,
+  title = {A ) b},
+  note = "x) @c(y"
+)
+"""
+SPECIAL_FIELDS = {
+    "k1": {"title": "Water (ice) phases", "year": "2020"},
+    "k2": {"note": "see @book{x} and a@b.com", "title": "T"},
+    "k3": {"title": "A ) b", "note": "x) @c(y"},
+}
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_parenthesised_entries_and_at_in_values(tmp_path, lazy):
+    fname = tmp_path / "special.bib"
+    fname.write_text(SPECIAL_ENTRIES)
+    bib_file = BibFile(str(fname), lazy=lazy)
+
+    assert {
+        key: dict(entry.fields) for key, entry in bib_file.bib_entries.items()
+    } == SPECIAL_FIELDS
+    streamed = iter_entries(str(fname), chunk_size=7)
+    assert {entry.id_key: dict(entry.fields) for entry in streamed} == SPECIAL_FIELDS
+
+
+MIXED_ENTRIES = """% Exported library
+
+@Control{control1,
+  x = {y}
+}
+Text after a control entry
+
+@article{m1,
+  title = {Nested {Braces} and ``quotes''},
+  author = "Pérez, José and Smith, J.",
+  year = 2020
+}
+
+@book(m2, title = {Parenthesis ) in a value}, note = "@inbook{x}")
+
+@misc{m3,
+  % a comment line
+  title = {No comma}
+  year = {1999},
+}
+
+@Control{control2,
+  x = {z}
+}
+"""
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 16, 1 << 16])
+def test_iter_entries_matches_bib_file(tmp_path, chunk_size):
+    fname = tmp_path / "mixed.bib"
+    fname.write_text(MIXED_ENTRIES + SPECIAL_ENTRIES)
+    bib_file = BibFile(str(fname))
+
+    streamed = list(iter_entries(str(fname), chunk_size=chunk_size))
+    assert [entry.id_key for entry in streamed] == list(bib_file.bib_entries)
+    assert [entry.type for entry in streamed] == [
+        entry.type for entry in bib_file.bib_entries.values()
+    ]
+    assert [dict(entry.fields) for entry in streamed] == [
+        dict(entry.fields) for entry in bib_file.bib_entries.values()
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 16])
+def test_iter_entries_unfinished_entry_raises(tmp_path, chunk_size):
+    fname = tmp_path / "unfinished.bib"
+    fname.write_text(MIXED_ENTRIES + "@article{m4,\n  title = {Cut")
+    with pytest.raises(ValueError, match="Invalid bibtex entry"):
+        list(iter_entries(str(fname), chunk_size=chunk_size))
+    with pytest.raises(ValueError, match="Invalid bibtex entry"):
+        BibFile(str(fname))
+
+
+def test_lazy_matches_eager(tmp_path):
+    fname = tmp_path / "mixed.bib"
+    fname.write_text(MIXED_ENTRIES + SPECIAL_ENTRIES + "@Control{c3, x = {w}}\n")
+    eager = BibFile(str(fname))
+    lazy = BibFile(str(fname), lazy=True)
+
+    assert list(lazy.bib_entries) == list(eager.bib_entries)
+    assert lazy.non_entry_lines == eager.non_entry_lines
+    assert len(lazy.non_entry_lines) == 3
+    for key, entry in eager.bib_entries.items():
+        assert lazy[key].type == entry.type
+        assert dict(lazy[key].fields) == dict(entry.fields)
+    assert str(lazy) == str(eager)
+
+
+def test_lazy_entries_are_loaded_when_accessed(tmp_path):
+    fname = tmp_path / "mixed.bib"
+    fname.write_text(MIXED_ENTRIES + SPECIAL_ENTRIES)
+    bib_file = BibFile(str(fname), lazy=True)
+    loaded = bib_file.bib_entries._data
+
+    assert len(bib_file.bib_entries) == 6
+    assert "m2" in bib_file.bib_entries
+    assert not any(isinstance(value, BibEntry) for value in loaded.values())
+    assert bib_file["m2"].fields["note"] == "@inbook{x}"
+    assert [key for key, value in loaded.items() if isinstance(value, BibEntry)] == [
+        "m2"
+    ]
+    assert bib_file["m2"] is bib_file["m2"]
+
+    str(bib_file)
+    assert all(isinstance(value, BibEntry) for value in loaded.values())
@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+from parsers import BibFile
+
+BIB = """% Header
+
+@Control{control,
+  ctrl-use-article-title = {yes}
+}
+
+@article{key1,
+  title = {First title},
+  year = {2020}
+}
+
+@book{key2,
+  title = {Second title}
+}
+"""
+
+
+@pytest.fixture
+def bib(tmp_path):
+    fname = tmp_path / "refs.bib"
+    fname.write_text(BIB)
+    return str(fname)
+
+
+def cache_files(cache_dir) -> list[str]:
+    return [
+        os.path.join(cache_dir, name)
+        for name in os.listdir(cache_dir)
+        if name.endswith(".bibcache")
+    ]
+
+
+def parse_without_scanning(fname: str, cache_dir, monkeypatch) -> BibFile:
+    """
+    Parses the bib file failing if it is not loaded from the cache.
+    """
+    with monkeypatch.context() as patch:
+        patch.setattr(BibFile, "_add_entries", None)
+        return BibFile(fname, cache_dir=str(cache_dir))
+
+
+def assert_same(bib_file: BibFile, expected: BibFile):
+    assert str(bib_file) == str(expected)
+    assert list(bib_file.bib_entries) == list(expected.bib_entries)
+    assert bib_file.non_entry_lines == expected.non_entry_lines
+
+
+def test_warm_cache_hit(bib, tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    cold = BibFile(bib, cache_dir=str(cache_dir))
+    assert len(cache_files(cache_dir)) == 1
+
+    warm = parse_without_scanning(bib, cache_dir, monkeypatch)
+    assert_same(warm, BibFile(bib))
+    assert_same(warm, cold)
+    warm.reload()
+    assert_same(warm, BibFile(bib))
+
+
+def test_content_change_with_same_size_and_mtime(bib, tmp_path):
+    cache_dir = tmp_path / "cache"
+    BibFile(bib, cache_dir=str(cache_dir))
+    stat = os.stat(bib)
+    with open(bib, "w") as f:
+        f.write(BIB.replace("First", "Other"))
+    os.utime(bib, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert os.stat(bib).st_size == stat.st_size
+
+    bib_file = BibFile(bib, cache_dir=str(cache_dir))
+    assert bib_file["key1"].fields["title"] == "Other title"
+    assert_same(bib_file, BibFile(bib))
+
+
+@pytest.mark.parametrize(
+    "corrupt",
+    [
+        lambda data: data[: len(data) // 2],
+        lambda data: b"",
+        lambda data: b"not a cache file",
+        lambda data: data[:10] + b"\xff" * 20 + data[30:],
+    ],
+)
+def test_truncated_or_corrupt_cache(bib, tmp_path, monkeypatch, corrupt):
+    cache_dir = tmp_path / "cache"
+    BibFile(bib, cache_dir=str(cache_dir))
+    (cache_file,) = cache_files(cache_dir)
+    with open(cache_file, "rb") as f:
+        data = f.read()
+    with open(cache_file, "wb") as f:
+        f.write(corrupt(data))
+
+    assert_same(BibFile(bib, cache_dir=str(cache_dir)), BibFile(bib))
+    # The cache is written again
+    assert_same(parse_without_scanning(bib, cache_dir, monkeypatch), BibFile(bib))
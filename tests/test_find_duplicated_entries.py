@@ -0,0 +1,113 @@
+import random
+import re
+from functools import lru_cache
+
+import pytest
+from pylatexenc.latex2text import LatexNodes2Text
+
+from parsers import BibFile
+
+CONVERTER = LatexNodes2Text()
+
+SURNAMES = ["Smith", "Garc{\\'i}a", 'M\\"uller', "Otero", "Nu\\~nez", "Wang"]
+WORDS = ["molecular", "dynamics", "of", "Ionic", "{DNA}", "caf\\'e", "na\\\"ive", "--"]
+TITLES = ["{X}", "x", "{y Z}", "Y z", "{\\'E}cole", "\\'ecole"]
+
+
+def generate_bib(n: int, seed: int) -> str:
+    """
+    Returns a bib file with n entries, many of them sharing their key, title,
+    doi or isbn.
+    """
+    r = random.Random(seed)
+    entries = []
+    for i in range(n):
+        fields = {
+            "author": " and ".join(r.choice(SURNAMES) for _ in range(r.randint(1, 3))),
+            "year": str(r.randint(1990, 2024)),
+        }
+        if r.random() < 0.2:
+            fields["title"] = r.choice(TITLES)
+        else:
+            fields["title"] = " ".join(r.choice(WORDS) for _ in range(r.randint(2, 5)))
+        if r.random() < 0.4:
+            fields["doi"] = "10.1/X{}".format(r.randint(0, n // 4))
+            if r.random() < 0.5:
+                fields["doi"] = fields["doi"].lower()
+        if r.random() < 0.1:
+            fields["isbn"] = "978-{}".format(r.randint(0, 20))
+        if r.random() < 0.05:
+            fields["title"] = ""
+        key = "key{}".format(i) if r.random() < 0.9 else "key{}".format(r.randint(0, i))
+        entries.append(
+            "@article{{{},\n".format(key)
+            + ",\n".join("  {} = {{{}}}".format(k, v) for k, v in fields.items())
+            + "\n}\n"
+        )
+    return "\n".join(entries)
+
+
+@lru_cache(maxsize=None)
+def old_lower_unicode(text: str) -> str:
+    return re.sub(r"[ {}]", "", CONVERTER.latex_to_text(text).lower())
+
+
+def old_equal(entry, other) -> bool:
+    """
+    BibEntry.__eq__ before the equality keys were indexed.
+    """
+    cond = entry.id_key == other.id_key
+    for field in ("title", "doi", "isbn"):
+        if field in entry.fields and field in other.fields:
+            if entry.fields[field] and other.fields[field]:
+                field_1 = entry.fields[field].lower()
+                field_2 = other.fields[field].lower()
+                if field == "title":
+                    field_1 = old_lower_unicode(field_1)
+                    field_2 = old_lower_unicode(field_2)
+                cond = cond or (field_1 == field_2)
+    return cond
+
+
+def old_find_duplicated_entries(bib_file: BibFile) -> list[list[str]]:
+    """
+    The pairwise search of BibFile.find_duplicated_entries before the index.
+    """
+    keys, values = list(bib_file.bib_entries), list(bib_file.bib_entries.values())
+    duplicated = []
+    remaining = list(range(len(keys)))
+    while remaining:
+        index = remaining.pop(0)
+        aux = [index]
+        for i in list(remaining):
+            if old_equal(values[index], values[i]):
+                aux.append(i)
+                remaining.remove(i)
+        if len(aux) > 1:
+            duplicated.append(aux)
+    return [[keys[i] for i in aux] for aux in duplicated]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_same_groups_as_pairwise_search(tmp_path, seed):
+    fname = tmp_path / "generated.bib"
+    fname.write_text(generate_bib(150 + 50 * seed, seed))
+    bib_file = BibFile(str(fname))
+
+    groups = bib_file.find_duplicated_entries()
+
+    assert groups
+    assert groups == old_find_duplicated_entries(bib_file)
+
+
+def test_groups_follow_modified_fields(tmp_path):
+    fname = tmp_path / "generated.bib"
+    fname.write_text(generate_bib(200, 7))
+    bib_file = BibFile(str(fname))
+    bib_file.find_duplicated_entries()
+    r = random.Random(7)
+    for entry in bib_file.bib_entries.values():
+        if r.random() < 0.2:
+            entry.fields["title"] = r.choice(TITLES)
+
+    assert bib_file.find_duplicated_entries() == old_find_duplicated_entries(bib_file)
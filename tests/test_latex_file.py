@@ -0,0 +1,164 @@
+import os
+import random
+import re
+
+import pytest
+
+from parsers import (
+    _INPUT_CACHE,
+    IncludedFile,
+    LatexFile,
+    _rematching,
+    clear_input_cache,
+)
+
+FRAGMENTS = [
+    " ",
+    "\n",
+    ".",
+    ",",
+    "x",
+    "Ref.",
+    "\\cite{a}",
+    "\\cite{a, b}",
+    "\\citenum{b}",
+    "\\cite[p.~1]{a}",
+    "\\label{fig:x}",
+    "\\ref{y}",
+    "\\includegraphics{f/g}",
+    "\\input{s1}",
+    "\\include{s2}",
+    "{",
+    "}",
+]
+
+
+@pytest.fixture
+def cycle(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "main.tex").write_text("a \\input{sub} b\n")
+    (tmp_path / "sub.tex").write_text("c \\input{main} d\n")
+    return LatexFile("main.tex")
+
+
+def test_substitute_inputs_detects_cycle_through_root(cycle):
+    with pytest.raises(ValueError, match="main.tex -> .*sub.tex -> .*main.tex"):
+        cycle.substitute_inputs()
+
+
+def test_transform_detects_cycle_through_root(cycle):
+    with pytest.raises(ValueError, match="main.tex -> .*sub.tex -> .*main.tex"):
+        cycle.transform()
+
+
+def test_include_tree_depths(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "main.tex").write_text("\\input{a} \\input{b}\n")
+    (tmp_path / "a.tex").write_text("\\input{b}\n")
+    (tmp_path / "b.tex").write_text("b\n")
+    latex_file = LatexFile("main.tex")
+    latex_file.substitute_inputs()
+
+    assert latex_file.modified_content == "b\n\n b\n\n"
+    assert latex_file.include_tree == [
+        IncludedFile(1, "input", "a.tex"),
+        IncludedFile(2, "input", "b.tex"),
+        IncludedFile(1, "input", "b.tex"),
+    ]
+
+
+def chained(fname: str, merged_dict: dict[str, str]) -> LatexFile:
+    latex_file = LatexFile(fname)
+    latex_file.substitute_inputs()
+    latex_file.fix_partial_paths()
+    latex_file.fix_labels_refs()
+    latex_file.adapt_citations()
+    latex_file.replace_cite_entries(merged_dict)
+    return latex_file
+
+
+def test_transform_across_included_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "main.tex").write_text("x \\input{sub}.")
+    (tmp_path / "sub.tex").write_text(" \\cite{a}")
+    latex_file = LatexFile("main.tex")
+    latex_file.transform(sections=False)
+
+    assert latex_file.modified_content == "x.\\cite{a} "
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_transform_as_chained_calls(tmp_path, monkeypatch, seed):
+    monkeypatch.chdir(tmp_path)
+    r = random.Random(seed)
+    merged_dict = {"a": "A"}
+    for _ in range(200):
+        for name in ("main", "s1", "s2"):
+            fragments = [r.choice(FRAGMENTS) for _ in range(r.randrange(8))]
+            if name != "main":
+                # Only include the following files, so there are no cycles
+                fragments = [f for f in fragments if f != "\\input{s1}"]
+            if name == "s2":
+                fragments = [f for f in fragments if f != "\\include{s2}"]
+            (tmp_path / (name + ".tex")).write_text("".join(fragments))
+        clear_input_cache()
+        latex_file = LatexFile("main.tex")
+        latex_file.transform(sections=False, merged_dict=merged_dict)
+        expected = chained("main.tex", merged_dict)
+
+        assert latex_file.modified_content == expected.modified_content
+        assert latex_file.include_tree == expected.include_tree
+
+
+def test_rematching_out_of_sync_raises():
+    replacement = _rematching("label_ref", lambda match: match.group(0))
+    with pytest.raises(RuntimeError, match="label_ref"):
+        replacement(re.match("x", "x"))
+
+
+def test_replace_cite_entries_replaces_whole_keys(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "main.tex").write_text(
+        "key1 and key12 in the text \\cite{key1}, \\cite{key12,key1}\n"
+        "\\cite[p.~3]{key1} \\citenum{ key12 , key1 } \\citeauthor{akey1}\n"
+        "\\cite[see][p.~3]{other, key1,\n  key2} \\ref{key1}\n"
+    )
+    latex_file = LatexFile("main.tex")
+    latex_file.replace_cite_entries({"key1": "new1", "key2": "new2"})
+
+    assert latex_file.modified_content == (
+        "key1 and key12 in the text \\cite{new1}, \\cite{key12,new1}\n"
+        "\\cite[p.~3]{new1} \\citenum{ key12 , new1 } \\citeauthor{akey1}\n"
+        "\\cite[see][p.~3]{other, new1,\n  new2} \\ref{key1}\n"
+    )
+
+
+def test_included_files_are_read_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name in ("a", "b", "c"):
+        (tmp_path / (name + ".tex")).write_text(
+            "{} \\input{{macros}} \\input{{./macros.tex}}\n".format(name)
+        )
+    macros = tmp_path / "macros.tex"
+    macros.write_text("m1\\endinput")
+    clear_input_cache()
+    reads = _INPUT_CACHE.reads
+
+    latex_files = [LatexFile(name + ".tex") for name in ("a", "b", "c")]
+    for latex_file in latex_files:
+        latex_file.substitute_inputs()
+    assert _INPUT_CACHE.reads == reads + 1
+    assert latex_files[2].modified_content == "c m1 m1\n"
+
+    # Same size, other modification time
+    macros.write_text("m2\\endinput")
+    stat = macros.stat()
+    os.utime(macros, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    latex_file = LatexFile("a.tex")
+    latex_file.substitute_inputs()
+    assert latex_file.modified_content == "a m2 m2\n"
+    macros.write_text("m3 longer")
+    latex_file = LatexFile("b.tex")
+    latex_file.substitute_inputs()
+    assert latex_file.modified_content == "b m3 longer m3 longer\n"
+    assert _INPUT_CACHE.reads == reads + 3
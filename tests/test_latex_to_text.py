@@ -0,0 +1,72 @@
+import itertools
+
+import pytest
+
+from parsers import (
+    ACCENT_CONVERTER,
+    convert_to_lower_unicode,
+    convert_to_lower_unicode_batch,
+    latex_to_text,
+    simplify_field,
+    simplify_field_batch,
+)
+
+SPACES = ["", " ", "\t", "\n", " \n ", "\n\n", "\n \n", " \n\n"]
+# Whitespace is inserted at each _
+TEMPLATES = [
+    "\\'_\\i_bx",
+    "\\'_{_e_}x",
+    "\\'_e_x",
+    "\\u_{_a_}y",
+    "\\v_c_z",
+    "\\c_{_\\i_}z",
+]
+
+
+def cases():
+    for template in TEMPLATES:
+        parts = template.split("_")
+        for spaces in itertools.product(SPACES, repeat=len(parts) - 1):
+            yield "".join(itertools.chain(*zip(parts, spaces), parts[-1:]))
+
+
+@pytest.mark.parametrize("text", list(cases()))
+def test_same_as_pylatexenc_with_whitespace(text):
+    assert latex_to_text(text) == ACCENT_CONVERTER.latex_to_text(text)
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["Garc{\\'i}a", 'M\\"uller', "Nu\\~nez", "Dvo\\v{r}\\'ak", "a -- b --- c~d", "50\\%"],
+)
+def test_same_as_pylatexenc(text):
+    assert latex_to_text(text) == ACCENT_CONVERTER.latex_to_text(text)
+
+
+BATCH_TEXTS = [
+    "A {Title} on M\\\"uller's Work",
+    "Dvo\\v{r}\\'ak, A. and Nu\\~nez, B.",
+    "pp. 10--20",
+    "A {Title} on M\\\"uller's Work",
+    "",
+    "{\\em Emphasis} and \\textbf{bold}",
+]
+
+
+@pytest.mark.parametrize(
+    "batch, function",
+    [
+        (convert_to_lower_unicode_batch, convert_to_lower_unicode),
+        (simplify_field_batch, simplify_field),
+    ],
+)
+# Texts with newlines, also from "\\\\", are normalized one by one
+@pytest.mark.parametrize(
+    "extra",
+    [[], ["Two\nlines", "Trailing newline\n"], ["Line \\\\ break"], ["\n"]],
+)
+def test_batch_same_as_each_value(batch, function, extra):
+    texts = BATCH_TEXTS + extra
+    assert batch(texts) == [function(text) for text in texts]
+    assert batch(iter(texts)) == [function(text) for text in texts]
+    assert batch(extra) == [function(text) for text in extra]
@@ -0,0 +1,158 @@
+import pytest
+
+from parsers import BibFile, MergeConflict
+
+FILES = [
+    """@article{shared,
+  title = {Shared title},
+  year = {2020}
+}
+
+@article{first,
+  title = {Only in the first file}
+}
+""",
+    """@article{shared,
+  title = {Shared title},
+  doi = {10.1/x}
+}
+
+@article{second,
+  title = {Only in the second file}
+}
+""",
+    """@article{second,
+  title = {Only in the second file},
+  year = {2022}
+}
+
+@article{third,
+  title = {Only in the third file}
+}
+""",
+]
+
+
+def read_files(tmp_path, texts=FILES):
+    bib_files = []
+    for i, text in enumerate(texts):
+        fname = tmp_path / "file{}.bib".format(i)
+        fname.write_text(text)
+        bib_files.append(BibFile(str(fname)))
+    return bib_files
+
+
+def test_merge_all_equals_sum(tmp_path, capsys):
+    bib_files = read_files(tmp_path)
+    added = sum(bib_files)
+    assert "duplicate key shared" in capsys.readouterr().out
+
+    merged = BibFile.merge_all(bib_files)
+    assert capsys.readouterr().out == ""
+    assert list(merged.bib_entries) == list(added.bib_entries)
+    assert merged.non_entry_lines == added.non_entry_lines
+    assert str(merged) == str(added)
+    assert merged.merge_conflicts == added.merge_conflicts
+    assert merged.merge_conflicts == [
+        MergeConflict("shared", bib_files[1].fname, "merge", "shared"),
+        MergeConflict("second", bib_files[2].fname, "merge", "second"),
+    ]
+    assert merged["shared"].fields["doi"] == "10.1/x"
+    assert merged["shared"].fields["year"] == "2020"
+
+
+def test_merge_all_keeps_the_files_unchanged(tmp_path):
+    bib_files = read_files(tmp_path)
+    texts = [str(bib_file) for bib_file in bib_files]
+    BibFile.merge_all(bib_files)
+    assert [str(bib_file) for bib_file in bib_files] == texts
+
+
+@pytest.mark.parametrize(
+    "action, kept_file, new_key",
+    [("keep", 0, None), ("replace", 1, "shared"), ("rename", 0, "sharedCopy1")],
+)
+def test_merge_all_policies(tmp_path, action, kept_file, new_key):
+    bib_files = read_files(tmp_path, FILES[:2])
+    calls = []
+
+    def policy(key, entry, other):
+        calls.append((key, entry, other))
+        return action
+
+    merged = BibFile.merge_all(bib_files, policy)
+    assert calls == [("shared", bib_files[0]["shared"], bib_files[1]["shared"])]
+    assert merged.merge_conflicts == [
+        MergeConflict("shared", bib_files[1].fname, action, new_key)
+    ]
+    assert merged["shared"] is bib_files[kept_file]["shared"]
+    if action == "rename":
+        assert merged["sharedCopy1"] is bib_files[1]["shared"]
+        assert list(merged.bib_entries) == [
+            "shared",
+            "first",
+            "sharedCopy1",
+            "second",
+        ]
+    else:
+        assert list(merged.bib_entries) == ["shared", "first", "second"]
+
+
+def test_merge_all_unknown_action_raises(tmp_path):
+    bib_files = read_files(tmp_path, FILES[:2])
+    with pytest.raises(ValueError, match="Unknown conflict policy action"):
+        BibFile.merge_all(bib_files, lambda key, entry, other: "ignore")
+
+
+def rename(key, entry, other):
+    return "rename"
+
+
+def test_copy_suffixes_across_files(tmp_path):
+    texts = [
+        "@article{{key,\n  title = {{Title {}}}\n}}\n".format(i) for i in range(4)
+    ]
+    texts[1] += "\n@article{keyCopy2,\n  title = {Taken}\n}\n"
+    bib_files = read_files(tmp_path, texts)
+    merged = BibFile.merge_all(bib_files, rename)
+    assert list(merged.bib_entries) == [
+        "key",
+        "keyCopy1",
+        "keyCopy2",
+        "keyCopy3",
+        "keyCopy4",
+    ]
+    assert merged["keyCopy2"].fields["title"] == "Taken"
+    assert [conflict.new_key for conflict in merged.merge_conflicts] == [
+        "keyCopy1",
+        "keyCopy3",
+        "keyCopy4",
+    ]
+
+
+def test_copy_suffixes_equal_chained_merges(tmp_path):
+    texts = [
+        "@article{{key,\n  title = {{Title {0}}}\n}}\n\n"
+        "@article{{keyCopy1,\n  title = {{Copy {0}}}\n}}\n".format(i)
+        for i in range(3)
+    ]
+    bib_files = read_files(tmp_path, texts)
+    merged = BibFile.merge_all(bib_files, rename)
+    chained = bib_files[0]
+    for bib_file in bib_files[1:]:
+        chained = BibFile.merge_all([chained, bib_file], rename)
+    assert list(merged.bib_entries) == list(chained.bib_entries)
+    assert str(merged) == str(chained)
+
+
+def test_renamed_keys(tmp_path):
+    bib_files = read_files(tmp_path)
+    merged = BibFile.merge_all(
+        bib_files, lambda key, entry, other: "rename" if key == "shared" else "keep"
+    )
+    assert merged.renamed_keys() == {bib_files[1].fname: {"shared": "sharedCopy1"}}
+    assert [conflict.action for conflict in merged.merge_conflicts] == [
+        "rename",
+        "keep",
+    ]
+    assert BibFile.merge_all(bib_files).renamed_keys() == {}
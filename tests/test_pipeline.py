@@ -0,0 +1,81 @@
+from parsers import Pipeline, convert_to_lower_unicode_batch
+
+BIB = """@article{a1,
+  title = {First title},
+  year = {2020}
+}
+
+@book{b1,
+  title = {Second title},
+  year = {2010}
+}
+
+@article{a2,
+  title = {first TITLE},
+  year = {2021}
+}
+"""
+
+
+def test_stages_do_not_parse_entries(tmp_path):
+    fname = tmp_path / "in.bib"
+    fname.write_text(BIB)
+    entries = list(Pipeline.from_file(str(fname)).filter(types=["article"]))
+
+    assert [entry.id_key for entry in entries] == ["a1", "a2"]
+    assert all(entry._fields_text is not None for entry in entries)
+
+
+def test_deduplicate_and_write(tmp_path):
+    fname = tmp_path / "in.bib"
+    fname.write_text(BIB)
+    fout = tmp_path / "out.bib"
+    pipeline = Pipeline.from_file(str(fname)).compute_equality_keys().deduplicate()
+
+    assert pipeline.write(str(fout)) == 2
+    assert "{a1," in fout.read_text() and "{b1," in fout.read_text()
+    stats = pipeline.stats()
+    assert [stage.name for stage in stats] == [
+        "parse",
+        "equality_keys",
+        "deduplicate",
+        "write",
+    ]
+    assert [stage.entries for stage in stats] == [3, 3, 2, 2]
+    assert stats[-1].bytes == len(fout.read_text()) - len(",\n\n")
+    assert all(stage.seconds >= 0 for stage in stats)
+
+
+def test_normalize(tmp_path):
+    fname = tmp_path / "in.bib"
+    fname.write_text(
+        BIB + '@misc{m1,\n  author = {M\\"uller, J. and Nu\\~nez, A.}\n}\n'
+    )
+    pipeline = Pipeline.from_file(str(fname)).normalize(batch_size=2)
+    entries = list(pipeline)
+
+    assert [entry.fields.get("title") for entry in entries] == [
+        "first title",
+        "second title",
+        "first title",
+        None,
+    ]
+    assert entries[3].fields["author"] == "müller, j and nuñez, a"
+    assert entries[0].fields["year"] == "2020"
+    assert [stage.name for stage in pipeline.stats()] == ["parse", "normalize"]
+    assert pipeline.stats()[-1].entries == 4
+
+
+def test_normalize_before_deduplicate(tmp_path):
+    fname = tmp_path / "in.bib"
+    fname.write_text(BIB)
+    pipeline = (
+        Pipeline.from_file(str(fname))
+        .normalize(["title"], convert_to_lower_unicode_batch)
+        .deduplicate()
+    )
+
+    entries = list(pipeline)
+    assert [entry.id_key for entry in entries] == ["a1", "b1"]
+    assert entries[0].fields["title"] == "firsttitle"
+    assert "title = {firsttitle}" in str(entries[0])
@@ -0,0 +1,108 @@
+import random
+
+import pytest
+
+from parsers import BibFile
+
+
+def generate_bib(n: int, seed: int) -> str:
+    r = random.Random(seed)
+    entries = ["% Header line\n\n"]
+    for i in range(n):
+        entries.append(
+            "@article{{key{},\n  title = {{Title {}}},\n  year = {{{}}}\n}}\n\n".format(
+                i, r.randrange(n), r.randint(1990, 2024)
+            )
+        )
+    return "".join(entries)
+
+
+def texts(bib_file: BibFile) -> dict:
+    """
+    Returns the text of the entries of a bib file, or ValueError for those
+    whose fields cannot be parsed.
+    """
+    texts = {}
+    for key, entry in bib_file.bib_entries.items():
+        try:
+            texts[key] = str(entry)
+        except ValueError:
+            texts[key] = ValueError
+    return texts
+
+
+def snapshot(bib_file: BibFile):
+    return list(texts(bib_file).items()), bib_file.non_entry_lines
+
+
+def edit(r: random.Random, text: str, step: int) -> str:
+    starts = [i for i, char in enumerate(text) if char == "@"]
+    i = r.choice(starts)
+    operation = r.choice(["char", "insert", "delete", "control", "duplicate", "many"])
+    if operation == "char":
+        i = r.randrange(len(text))
+        return text[:i] + r.choice(["x", "", "Q", "{"]) + text[i + 1 :]
+    if operation == "insert":
+        entry = "@article{{new{0},\n  title = {{New {0}}}\n}}\n\n".format(step)
+        return text[:i] + entry + text[i:]
+    if operation == "delete":
+        j = r.choice(starts + [len(text)])
+        i, j = min(i, j), max(i, j)
+        return text[:i] + text[j:]
+    if operation == "control":
+        entry = "@Control{{control{},\n  x = {{y}}\n}}\nJunk line\n".format(step)
+        return text[:i] + entry + text[i:]
+    if operation == "duplicate":
+        return text[:i] + "@misc{key5,\n  title = {Duplicate}\n}\n" + text[i:]
+    for _ in range(3):
+        i = r.randrange(len(text))
+        text = text[:i] + "z" + text[i:]
+    return text
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_reload_matches_fresh_parse(tmp_path, seed):
+    r = random.Random(seed)
+    fname = tmp_path / "refs.bib"
+    fname.write_text(generate_bib(40, seed))
+    bib_file = BibFile(str(fname))
+    for step in range(50):
+        text = edit(r, fname.read_text(), step)
+        fname.write_text(text)
+        before = texts(bib_file)
+        try:
+            fresh = BibFile(str(fname))
+        except ValueError:
+            with pytest.raises(ValueError):
+                bib_file.reload()
+            fname.write_text(generate_bib(40, seed))
+            bib_file = BibFile(str(fname))
+            continue
+        update = bib_file.reload()
+
+        assert snapshot(bib_file) == snapshot(fresh)
+        after = texts(fresh)
+        changed = set(update.added) | set(update.removed) | set(update.modified)
+        assert set(after) - set(before) <= set(update.added) | set(update.modified)
+        assert set(before) - set(after) <= set(update.removed) | set(update.modified)
+        assert {
+            key for key in after.keys() & before.keys() if after[key] != before[key]
+        } <= changed
+
+
+def test_reload_keeps_unchanged_entries(tmp_path):
+    fname = tmp_path / "refs.bib"
+    text = generate_bib(10, 0)
+    fname.write_text(text)
+    bib_file = BibFile(str(fname))
+    entries = dict(bib_file.bib_entries)
+    start = text.index("@article{key5")
+    fname.write_text(
+        text[:start] + "@book{added,\n  title = {Added}\n}\n\n" + text[start:]
+    )
+    update = bib_file.reload()
+
+    assert update.added == ["added"]
+    assert update.removed == [] and update.modified == []
+    assert list(bib_file.bib_entries) == [*entries][:5] + ["added"] + [*entries][5:]
+    assert all(bib_file[key] is entry for key, entry in entries.items())
@@ -0,0 +1,55 @@
+import itertools
+
+from parsers import BibFile
+from test_find_duplicated_entries import generate_bib
+
+
+def test_candidates_are_the_pairs_sharing_a_block_key(tmp_path):
+    fname = tmp_path / "generated.bib"
+    fname.write_text(generate_bib(300, 3))
+    bib_file = BibFile(str(fname))
+    entries = list(bib_file.bib_entries.values())
+    block_keys = [entry.similarity_block_keys() for entry in entries]
+    expected = [
+        (i, j)
+        for i, j in itertools.combinations(range(len(entries)), 2)
+        if not block_keys[i].isdisjoint(block_keys[j])
+    ]
+
+    candidates = list(bib_file.iter_similar_candidates())
+
+    assert len(candidates) == len(set(candidates))
+    assert sorted(candidates) == expected
+    assert bib_file.similar_candidates() == expected
+
+
+def test_weak_fields_are_not_paired_alone(tmp_path):
+    fname = tmp_path / "weak.bib"
+    fname.write_text(
+        "@article{a,\n  title = {One}, year = {2020}, volume = {3}\n}\n"
+        "@article{b,\n  title = {Two}, year = {2020}, volume = {3}\n}\n"
+        "@article{c,\n  title = {Two}, year = {2020}, pages = {1--2}\n}\n"
+    )
+    bib_file = BibFile(str(fname))
+
+    assert bib_file.similar_candidates() == [(1, 2)]
+
+
+def test_similar_pairs_in_processes_match_the_serial_scan(tmp_path):
+    fname = tmp_path / "generated.bib"
+    fname.write_text(generate_bib(200, 4))
+    bib_file = BibFile(str(fname))
+    entries = list(bib_file.bib_entries.values())
+    candidates = [
+        (i, j)
+        for i, j in bib_file.similar_candidates()
+        if entries[i].is_similar(entries[j])
+    ]
+    exhaustive = [
+        (i, j)
+        for i, j in itertools.combinations(range(len(entries)), 2)
+        if entries[i].is_similar(entries[j])
+    ]
+
+    assert bib_file.similar_pairs(jobs=2) == candidates
+    assert bib_file.similar_pairs(jobs=2, exhaustive=True) == exhaustive
@@ -0,0 +1,36 @@
+import os
+import stat
+
+import pytest
+
+from parsers import BibFile
+
+
+@pytest.fixture
+def bib_file():
+    bib_file = BibFile()
+    bib_file.parse_entry("article{key1,\n  title = {A title}\n}")
+    return bib_file
+
+
+def test_atomic_write_new_file_uses_umask(tmp_path, bib_file):
+    fout = tmp_path / "out.bib"
+    umask = os.umask(0o027)
+    try:
+        bib_file.write(str(fout), atomic=True)
+    finally:
+        os.umask(umask)
+
+    assert fout.read_text() == str(bib_file)
+    assert stat.S_IMODE(fout.stat().st_mode) == 0o640
+    assert os.listdir(tmp_path) == ["out.bib"]
+
+
+def test_atomic_write_keeps_mode_of_existing_file(tmp_path, bib_file):
+    fout = tmp_path / "out.bib"
+    fout.write_text("old")
+    fout.chmod(0o604)
+    bib_file.write(str(fout), atomic=True)
+
+    assert fout.read_text() == str(bib_file)
+    assert stat.S_IMODE(fout.stat().st_mode) == 0o604